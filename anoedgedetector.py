@@ -3,9 +3,16 @@ from river.anomaly.base import AnomalyDetector
 from hcmsanoedgeglobal import HcmsAnoedgeGlobal
 from hcmsanoedgelocal import HcmsAnoedgeLocal
 from hcms import Hcms
+from sharedsketch import SharedSketch
+from nodeinterner import NodeInterner
+import numpy as np
+import json
+import os
 
 class AnoedgeDetector(anomaly.base.AnomalyDetector):
-    def __init__(self, rows: int, buckets: int, decay_factor: float, type: str, num_dense_submatrices: int = 1):
+    def __init__(self, rows: int, buckets: int, decay_factor: float, type: str, num_dense_submatrices: int = 1, lazy_decay: bool = False,
+                 workers: int = 1, executor: str = 'thread', dtype=np.float64, storage: str = 'dense', seed: int = None,
+                 node_cache_size: int = None, staleness: float = 0.0):
         """
         Initialize AnoedgeGlobal class.
 
@@ -15,20 +22,139 @@ class AnoedgeDetector(anomaly.base.AnomalyDetector):
         - decay_factor (float): Decay factor.
         - type (str): global or local.
         - num_dense_submatrices (int): Number of dense submatrices.
+        - lazy_decay (bool): If True, the sketch decays through a scale factor instead of
+          multiplying the count tensor. Either way, decay_factor ** dt is applied when time
+          advances by dt.
+        - workers (int): Global detector only. Number of workers scoring the CMS rows
+          concurrently. The local detector updates the dense submatrices of all rows
+          together, see SubmatrixStack.
+        - executor (str): Global detector only. Kind of workers, either thread or process.
+        - dtype: Data type of the count tensor, float64 or float32. The sketch is decayed,
+          so integer dtypes are not supported.
+        - storage (str): Storage of the count tensor, either dense or sparse.
+        - seed (int): Seed of the hash functions. Detectors built with the same seed can
+          merge their sketches, see Hcms.merge.
+        - node_cache_size (int): If set, nodes may be any hashable key (strings, IP
+          addresses, tuples...), and the bucket vectors of this many recent nodes are
+          cached, see NodeInterner.
+        - staleness (float): Global detector only. Fraction of the mass of a CMS row that
+          may change before its cached densities are dropped. Edges on a seed cell seen
+          since are scored from the cache, see HcmsAnoedgeGlobal for the error bound. 0 runs
+          the exact greedy expansion for every edge.
         """
+        if not np.issubdtype(dtype, np.floating):
+            raise ValueError(f"Invalid dtype: {np.dtype(dtype)}. AnoEdge sketches are decayed and need a floating point dtype.")
 
         self.decay_factor = decay_factor
         self.last_time = 0
         self.type = type
+        self.num_dense_submatrices = num_dense_submatrices
 
         if type == 'global':
-            self.hcms = HcmsAnoedgeGlobal(rows, buckets)
+            self.hcms = HcmsAnoedgeGlobal(rows, buckets, lazy_decay, workers, executor, dtype, storage, seed, staleness)
         elif type == 'local':
-            self.hcms = HcmsAnoedgeLocal(rows, buckets, num_dense_submatrices)
+            self.hcms = HcmsAnoedgeLocal(rows, buckets, num_dense_submatrices, lazy_decay, dtype, storage, seed)
             self.hcms.initialize_dense_submatrices()
         else:
             ValueError(f"Invalid value: {type}. Value must be either local or global.")
+        self.interner = NodeInterner(self.hcms, node_cache_size) if node_cache_size is not None else None
     
+    def save(self, directory: str) -> None:
+        """
+        Saves the full detector state into a directory: the sketch (count.npy, hash
+        parameters and decay scale), the dense submatrices of a local detector, and
+        the detector parameters (including node_cache_size) with last_time.
+
+        Parameters:
+        - directory (str): Destination directory, created if needed.
+        """
+        self.hcms.save(directory)
+        state = {
+            'rows': self.hcms.num_rows,
+            'buckets': self.hcms.num_buckets,
+            'decay_factor': self.decay_factor,
+            'type': self.type,
+            'num_dense_submatrices': self.num_dense_submatrices,
+            'staleness': getattr(self.hcms, 'staleness', 0.0),
+            'node_cache_size': self.interner.capacity if self.interner is not None else None,
+            'last_time': np.asarray(self.last_time).item(),
+        }
+        with open(os.path.join(directory, 'detector.json'), 'w') as file:
+            json.dump(state, file)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, workers: int = 1, executor: str = 'thread') -> 'AnoedgeDetector':
+        """
+        Builds a detector from a directory written by save.
+
+        Parameters:
+        - directory (str): Directory written by save.
+        - mmap (bool): If True, the count tensor is memory-mapped copy-on-write, so
+          loading does not read the whole tensor upfront.
+        - workers (int): Global detector only. Number of workers scoring the CMS rows concurrently.
+        - executor (str): Global detector only. Kind of workers, either thread or process.
+
+        Returns:
+        - AnoedgeDetector: The restored detector.
+        """
+        with open(os.path.join(directory, 'detector.json'), 'r') as file:
+            state = json.load(file)
+        with open(os.path.join(directory, 'hcms.json'), 'r') as file:
+            hcms_state = json.load(file)
+
+        detector = cls(state['rows'], state['buckets'], state['decay_factor'], state['type'],
+                       state['num_dense_submatrices'], hcms_state['lazy_decay'], workers, executor,
+                       np.dtype(hcms_state['dtype']), hcms_state['storage'], hcms_state.get('seed'),
+                       node_cache_size=state.get('node_cache_size'), staleness=state.get('staleness', 0.0))
+        detector.hcms.restore(directory, mmap)
+        detector.last_time = state['last_time']
+        return detector
+
+    def share(self, name: str) -> None:
+        """
+        Moves the sketch into a named shared memory segment, with this detector as its
+        single writer.
+
+        Parameters:
+        - name (str): Name of the segment.
+        """
+        self.hcms.share(name)
+
+    @classmethod
+    def attach(cls, name: str, workers: int = 1) -> 'AnoedgeDetector':
+        """
+        Builds a read-only global detector on a sketch shared by another process. It
+        can only score; a local detector updates its submatrices while scoring, so it
+        cannot be a reader.
+
+        Parameters:
+        - name (str): Name of the segment.
+        - workers (int): Number of threads scoring the CMS rows concurrently.
+
+        Returns:
+        - AnoedgeDetector: The reader.
+        """
+        shared = SharedSketch.attach(name)
+        rows, buckets, dtype = shared.num_rows(), shared.num_buckets(), shared.dtype()
+        shared.close()
+
+        detector = cls(rows, buckets, 1.0, 'global', workers=workers, dtype=dtype)
+        detector.hcms.attach(name)
+        return detector
+
+    def close(self) -> None:
+        """
+        Shuts down the scoring workers and frees the shared memory segment used with
+        executor='process'. The detector stays usable, with its sketch in private memory.
+        """
+        self.hcms.close()
+
+    def __enter__(self) -> 'AnoedgeDetector':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
     def get_rows(self):
         return self.hcms.num_rows
     
@@ -48,12 +174,20 @@ class AnoedgeDetector(anomaly.base.AnomalyDetector):
 
         """
 
-        if x['time'] > self.last_time:
-            self.hcms.decay(self.decay_factor)
-        
-        self.last_time = x['time']
+        src_buckets = self._node_buckets(x['src'])
+        dst_buckets = self._node_buckets(x['dst'])
 
-        self.hcms.insert(x['src'], x['dst'], 1)
+        self._advance_time(x['time'])
+
+        self.hcms.insert_buckets(src_buckets, dst_buckets, 1)
+
+    def _advance_time(self, time) -> None:
+        # Decays the sketch when time advances, once per elapsed tick, so skipped ticks
+        # decay the same way whether decay is lazy or not.
+        if time > self.last_time:
+            self.hcms.decay(self.decay_factor ** (time - self.last_time))
+
+        self.last_time = time
         
     def score_one(self, x: dict) -> float:
         """
@@ -70,7 +204,116 @@ class AnoedgeDetector(anomaly.base.AnomalyDetector):
         - float: the anomaly score.
         """
 
+        src_buckets = self._node_buckets(x['src'])[:, 0].tolist()
+        dst_buckets = self._node_buckets(x['dst'])[:, 0].tolist()
+        return self._score_buckets(src_buckets, dst_buckets)
+
+    def score_learn_one(self, x: dict) -> float:
+        """
+        Calculate the score of x, then add x to the graph. Same result as score_one
+        followed by learn_one, but the buckets of src and dst are computed once and
+        reused for scoring and inserting. Prefer it in online loops.
+
+        Parameters:
+        - x (dict): Input to score and add to the graph.
+        keys ares:
+            - src : Source node
+            - dst : Destination node
+            - time: Time corresponding to the node
+
+        Returns:
+        - float: the anomaly score, before x is added.
+        """
+        src_buckets = self._node_buckets(x['src'])
+        dst_buckets = self._node_buckets(x['dst'])
+
+        score = self._score_buckets(src_buckets[:, 0].tolist(), dst_buckets[:, 0].tolist())
+        self._advance_time(x['time'])
+        self.hcms.insert_buckets(src_buckets, dst_buckets, 1)
+        return score
+
+    def _score_buckets(self, src_buckets: list, dst_buckets: list) -> float:
         if self.type == 'global':
-            return self.hcms.get_anoedgeglobal_score(x['src'], x['dst'])
+            return self.hcms.read_consistent(lambda: self.hcms.get_anoedgeglobal_bucket_score(src_buckets, dst_buckets))
+        return self.hcms.get_anoedgelocal_bucket_score(src_buckets, dst_buckets)
+
+    def _node_buckets(self, node) -> np.ndarray:
+        # Buckets of a node in every row, as a single column.
+        if self.interner is not None:
+            return self.interner.buckets(node)[:, None]
+        return self.hcms.hash_many(node)
+
+    def _hash_batch(self, X):
+        # Hashes the edges of a batch at once, one column of buckets per edge.
+        if self.interner is not None:
+            src_buckets = self.interner.buckets_many(X['src'])
+            dst_buckets = self.interner.buckets_many(X['dst'])
         else:
-            return self.hcms.get_anoedgelocal_score(x['src'], x['dst'])
\ No newline at end of file
+            src_buckets = self.hcms.hash_many(X['src'])
+            dst_buckets = self.hcms.hash_many(X['dst'])
+        if src_buckets.shape != dst_buckets.shape:
+            raise ValueError("src and dst must have the same length.")
+        return src_buckets, dst_buckets
+
+    def learn_many(self, X) -> None:
+        """
+        Add a batch of edges to the graph, with the same result as calling learn_one on
+        every edge in order. Edges are hashed at once, and the edges between two time
+        advances are inserted together.
+
+        Parameters:
+        - X (pd.DataFrame or dict): Columns src, dst and time, as a DataFrame or a dict of
+          NumPy arrays.
+
+        """
+        src_buckets, dst_buckets = self._hash_batch(X)
+        times = np.asarray(X['time']).ravel().tolist()
+        if not times:
+            return
+
+        # The sketch decays only where time increases, so the edges in between form one insert.
+        starts = np.flatnonzero(np.diff(times) > 0) + 1
+        bounds = [0] + starts.tolist() + [len(times)]
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            self._advance_time(times[begin])
+            self.hcms.insert_buckets(src_buckets[:, begin:end], dst_buckets[:, begin:end], 1)
+            self.last_time = times[end - 1]
+
+    def score_many(self, X) -> np.ndarray:
+        """
+        Calculate the score of every edge of a batch, with the same result as calling
+        score_one on every edge in order.
+
+        Parameters:
+        - X (pd.DataFrame or dict): Columns src and dst (time is not needed), as a
+          DataFrame or a dict of NumPy arrays.
+
+        Returns:
+        - np.ndarray: The anomaly scores.
+        """
+        src_buckets, dst_buckets = self._hash_batch(X)
+        return np.array([self._score_buckets(src, dst) for src, dst in
+                         zip(src_buckets.T.tolist(), dst_buckets.T.tolist())], dtype=float)
+
+    def score_learn_many(self, X) -> np.ndarray:
+        """
+        Score then learn every edge of a batch, with the same result as calling score_one
+        then learn_one on every edge in order: each edge is scored against the sketch
+        holding all the edges before it.
+
+        Parameters:
+        - X (pd.DataFrame or dict): Columns src, dst and time, as a DataFrame or a dict of
+          NumPy arrays.
+
+        Returns:
+        - np.ndarray: The anomaly scores.
+        """
+        src_buckets, dst_buckets = self._hash_batch(X)
+        times = np.asarray(X['time']).ravel().tolist()
+        scores = np.empty(src_buckets.shape[1], dtype=float)
+
+        for k, (src, dst, time) in enumerate(zip(src_buckets.T.tolist(), dst_buckets.T.tolist(), times)):
+            scores[k] = self._score_buckets(src, dst)
+            self._advance_time(time)
+            self.hcms.insert_buckets(src_buckets[:, k:k + 1], dst_buckets[:, k:k + 1], 1)
+        return scores
@@ -2,19 +2,85 @@ from river import anomaly
 from river.anomaly.base import AnomalyDetector
 from hcmsanograph import HcmsAnograph
 from hcms import Hcms
+from edgebuffer import EdgeBuffer
+from sharedsketch import SharedSketch
+from nodeinterner import NodeInterner
+from collections.abc import Iterable
+import numpy as np
 
 class AnographDetector(anomaly.base.AnomalyDetector):
-    def __init__(self, rows: int, buckets: int):
+    def __init__(self, rows: int, buckets: int, time_window: int = None,
+                 workers: int = 1, executor: str = 'thread', dtype=np.float64,
+                 storage: str = 'dense', seed: int = None, node_cache_size: int = None):
         """
         Initialize AnoedgeGlobal class.
 
         Args:
         - rows (int): Number of rows.
         - buckets (int): Number of buckets.
+        - time_window (int): If set, the detector works on a sliding window of this length:
+          edges are added with learn_one and score_one scores the edges of the current window.
+        - workers (int): Number of workers scoring the CMS rows concurrently.
+        - executor (str): Kind of workers, either thread or process.
+        - dtype: Data type of the count tensor, e.g. float64, float32, int32 or uint16.
+        - storage (str): Storage of the count tensor, either dense or sparse.
+        - seed (int): Seed of the hash functions. Detectors built with the same seed can
+          merge their sketches, see Hcms.merge.
+        - node_cache_size (int): If set, nodes may be any hashable key (strings, IP
+          addresses, tuples...), and the bucket vectors of this many recent nodes are
+          cached, see NodeInterner.
         """
 
-        self.hcms = HcmsAnograph(rows, buckets)
+        self.hcms = HcmsAnograph(rows, buckets, workers, executor, dtype, storage, seed)
+        self.time_window = time_window
+        self.edges = EdgeBuffer() if time_window is not None else None
+        self.interner = NodeInterner(self.hcms, node_cache_size) if node_cache_size is not None else None
     
+    def share(self, name: str) -> None:
+        """
+        Moves the sketch into a named shared memory segment, with this detector as its
+        single writer. Meant for the sliding window mode, where readers attached with
+        attach score the window maintained by this detector.
+
+        Parameters:
+        - name (str): Name of the segment.
+        """
+        self.hcms.share(name)
+
+    @classmethod
+    def attach(cls, name: str, workers: int = 1) -> 'AnographDetector':
+        """
+        Builds a read-only detector on a sketch shared by another process. Its
+        score_one scores the shared sketch as it is and ignores x.
+
+        Parameters:
+        - name (str): Name of the segment.
+        - workers (int): Number of threads scoring the CMS rows concurrently.
+
+        Returns:
+        - AnographDetector: The reader.
+        """
+        shared = SharedSketch.attach(name)
+        rows, buckets, dtype = shared.num_rows(), shared.num_buckets(), shared.dtype()
+        shared.close()
+
+        detector = cls(rows, buckets, workers=workers, dtype=dtype)
+        detector.hcms.attach(name)
+        return detector
+
+    def close(self) -> None:
+        """
+        Shuts down the scoring workers and frees the shared memory segment used with
+        executor='process'. The detector stays usable, with its sketch in private memory.
+        """
+        self.hcms.close()
+
+    def __enter__(self) -> 'AnographDetector':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
     def get_rows(self):
         return self.hcms.num_rows
     
@@ -22,8 +88,42 @@ class AnographDetector(anomaly.base.AnomalyDetector):
         return self.hcms.num_buckets
 
     def learn_one(self, x: dict):
-        return
-        
+        """
+        In sliding window mode, add edges to the window and remove the edges that expired.
+        Does nothing otherwise.
+
+        Parameters:
+        - x (dict): Edges to add, in non-decreasing time order.
+        keys ares:
+            - src : Source node, or list or NumPy array of Source node
+            - dst : Destination node, or list or NumPy array of Destination node
+            - time : Time of the edges
+        """
+        if self.time_window is None:
+            return
+
+        src, src_buckets = self._intern(x['src'])
+        dst, dst_buckets = self._intern(x['dst'])
+        time = np.asarray(x['time'], dtype=np.int64)
+
+        if len(src) > 0:
+            self.edges.push(src, dst, np.broadcast_to(time, src.shape))
+            self.hcms.insert_buckets(src_buckets, dst_buckets, 1)
+
+        if time.size > 0:
+            expired_src, expired_dst = self.edges.pop_until(np.max(time) - self.time_window)
+            self.hcms.remove_many(expired_src, expired_dst, 1)
+
+    def _intern(self, nodes):
+        # Integer ids and buckets (one column per node) of a node or a sequence of nodes.
+        if self.interner is None:
+            ids = np.atleast_1d(np.asarray(nodes, dtype=np.int64))
+            return ids, self.hcms.hash_many(ids)
+        # Strings and tuples are single keys.
+        if isinstance(nodes, (str, bytes, tuple)) or not isinstance(nodes, Iterable):
+            nodes = [nodes]
+        return self.interner.intern_many(nodes)
+
     def score_one(self, x: dict, method: str = 'normal', k:int = None) -> float:
         """
         Calculate anomaly scre of a graph described by x
@@ -31,28 +131,30 @@ class AnographDetector(anomaly.base.AnomalyDetector):
         Parameters:
         - x (dict): Input to add to the graph.
         keys ares:
-            - src : list of Source node
-            - dst : list of Destination node
+            - src : list or NumPy array of Source node
+            - dst : list or NumPy array of Destination node
+          The int64 arrays yielded by utils.iter_graphs are hashed without copying.
+          In sliding window mode, or on a reader built with attach, x is ignored and
+          the current sketch is scored.
         - method (str) method used to get the score either normal or top-k
 
         Returns:
         - float: the anomaly score.
         """
-        self.hcms.clear()
-        for i in range(len(x['src'])):
-            self.hcms.insert(x['src'][i], x['dst'][i], 1)
-            
-        
+        if self.time_window is None and not self.hcms.read_only:
+            self.hcms.clear()
+            self.hcms.insert_buckets(self._intern(x['src'])[1], self._intern(x['dst'])[1], 1)
+
     
         if method == 'normal':
-            return self.hcms.get_anograph_score()
+            return self.hcms.read_consistent(self.hcms.get_anograph_score)
         
         elif method == 'top-k':
             if k is None:
                 ValueError(f"k can't be None when using top-k method.")
                 return
             else:
-                return self.hcms.get_anograph_k_score(k)
+                return self.hcms.read_consistent(lambda: self.hcms.get_anograph_k_score(k))
         else:
             ValueError(f"Invalid value: {type}. Value must be either local or global.")
 
@@ -0,0 +1,84 @@
+import numpy as np
+
+class EdgeBuffer:
+    def __init__(self, capacity: int = 1024):
+        """
+        Initializes a ring buffer holding the edges currently inside a sliding window.
+        Edges must be pushed in non-decreasing time order.
+
+        Parameters:
+        - capacity (int): Initial number of edges the buffer can hold. It doubles when full.
+
+        """
+        self.src = np.empty(capacity, dtype=np.int64)
+        self.dst = np.empty(capacity, dtype=np.int64)
+        self.time = np.empty(capacity, dtype=np.int64)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def capacity(self) -> int:
+        """Return the number of edges the buffer can hold without growing."""
+        return len(self.time)
+
+    def _take(self, arr: np.ndarray, n: int) -> np.ndarray:
+        """Return the n oldest entries of arr, in arrival order."""
+        end = self.head + n
+        if end <= self.capacity():
+            return arr[self.head:end].copy()
+        return np.concatenate((arr[self.head:], arr[:end - self.capacity()]))
+
+    def _grow(self, min_capacity: int) -> None:
+        new_capacity = self.capacity()
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+
+        for name in ('src', 'dst', 'time'):
+            arr = np.empty(new_capacity, dtype=np.int64)
+            arr[:self.size] = self._take(getattr(self, name), self.size)
+            setattr(self, name, arr)
+        self.head = 0
+
+    def push(self, src: np.ndarray, dst: np.ndarray, time: np.ndarray) -> None:
+        """
+        Append edges at the end of the buffer.
+
+        Parameters:
+        - src (np.ndarray): Source nodes.
+        - dst (np.ndarray): Destination nodes.
+        - time (np.ndarray): Time of each edge.
+
+        """
+        n = len(src)
+        if self.size + n > self.capacity():
+            self._grow(self.size + n)
+
+        idx = (self.head + self.size + np.arange(n)) % self.capacity()
+        self.src[idx] = src
+        self.dst[idx] = dst
+        self.time[idx] = time
+        self.size += n
+
+    def pop_until(self, time: int):
+        """
+        Remove every edge whose time is lower than or equal to time.
+
+        Parameters:
+        - time (int): Latest time to expire.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: Source and destination nodes of the removed edges.
+        """
+        first = self.time[self.head:min(self.head + self.size, self.capacity())]
+        n = int(np.searchsorted(first, time, side='right'))
+        if n == len(first) and n < self.size:
+            second = self.time[:self.size - n]
+            n += int(np.searchsorted(second, time, side='right'))
+
+        src = self._take(self.src, n)
+        dst = self._take(self.dst, n)
+        self.head = (self.head + n) % self.capacity()
+        self.size -= n
+        return src, dst
@@ -1,35 +1,400 @@
-from submatrix import Submatrix
+from rowexecutor import RowExecutor
+from sparsecount import SparseCount, SparseMatrix
+from sharedsketch import SharedSketch
 import numpy as np
+import contextlib
+import heapq
+import io
+import json
+import os
 
 class Hcms:
-    def __init__(self, r: int, b: int):
+    # Bounds of the lazy decay scale before the count tensor gets renormalized.
+    MIN_SCALE = 1e-64
+    MAX_SCALE = 1e64
+    # Attempts of read_consistent on a shared sketch before it scores a copy.
+    READ_RETRIES = 3
+    # Steps of a greedy expansion between two checks of its early stop.
+    STOP_CHECK = 4
+
+    def __init__(self, r: int, b: int, lazy_decay: bool = False, workers: int = 1, executor: str = 'thread',
+                 dtype=np.float64, storage: str = 'dense', seed: int = None):
         """
         Initializes an Hcms object.
 
+        The count dtype trades memory for precision. float32 halves the memory and keeps
+        about 7 significant digits, so scores stay within a relative 1e-5 of float64.
+        Integer dtypes are exact but cannot be decayed, and unsigned 16-bit counters
+        wrap around past 65535 edges per cell. Density kernels always accumulate in float64.
+
+        With sparse storage only the non-zero cells are kept, and the density kernels
+        follow the non-zero cells, so large bucket counts stay affordable when most
+        cells are empty.
+
         Parameters:
         - r (int): Number of rows.
         - b (int): Number of buckets.
+        - lazy_decay (bool): If True, decay only updates a global scale factor instead of the count tensor.
+        - workers (int): Number of workers used to score the rows concurrently.
+        - executor (str): Kind of workers, either thread or process.
+        - dtype: Data type of the count tensor.
+        - storage (str): Storage of the count tensor, either dense or sparse.
+        - seed (int): Seed of the hash functions. Sketches built with the same seed hash
+          nodes to the same buckets and can be merged. If None, the global NumPy random
+          state is used.
 
         """
+        if storage not in ('dense', 'sparse'):
+            raise ValueError(f"Invalid value: {storage}. Value must be either dense or sparse.")
+        if storage == 'sparse' and executor == 'process' and workers > 1:
+            raise ValueError("Sparse storage cannot be shared with worker processes, use threads.")
+        if lazy_decay and not np.issubdtype(dtype, np.floating):
+            raise ValueError(f"Invalid dtype: {np.dtype(dtype)}. Lazy decay requires a floating point dtype.")
+
         self.num_rows = r
         self.num_buckets = b
+        self.lazy_decay = lazy_decay
+        self.storage = storage
+        # Set by share (writer) or attach (read-only reader).
+        self.shared = None
+        self.read_only = False
+        # count holds the true counts divided by scale.
+        self.scale = 1.0
+        self.seed = seed
         
-        self.hash_a = np.random.randint(1, b, size=r)
-        self.hash_b = np.random.randint(0, b, size=r)
-        self.count = np.zeros((r, b, b))
+        rng = np.random if seed is None else np.random.RandomState(seed)
+        self.hash_a = rng.randint(1, b, size=r)
+        self.hash_b = rng.randint(0, b, size=r)
+        self.executor = RowExecutor(workers, executor)
+        if storage == 'sparse':
+            self.count = SparseCount(r, b, dtype)
+        else:
+            self.count = self.executor.allocate((r, b, b), dtype)
+
+        if np.issubdtype(self.count.dtype, np.floating):
+            # Keep count / scale far from overflow for narrow float types.
+            bound = min(self.MAX_SCALE, float(np.finfo(self.count.dtype).max) ** 0.25)
+            self.MIN_SCALE, self.MAX_SCALE = 1.0 / bound, bound
 
 
     def clear(self) -> None:
         """
-        Resets the count attribute to a three-dimensional array filled with zeros.
+        Resets the count attribute to zeros, reusing the existing buffer.
         """
-        self.count = np.zeros((self.num_rows, self.num_buckets, self.num_buckets))
+        with self._writing():
+            self.count.fill(0)
+            self.scale = 1.0
 
 
     def hash(self, elem: int, i: int) -> int:
         resid = (elem * self.hash_a[i] + self.hash_b[i]) % self.num_buckets
         return resid + self.num_buckets if resid < 0 else resid
 
+    def close(self) -> None:
+        """
+        Shuts down the scoring workers and moves the count tensor out of shared memory.
+        """
+        self.executor.close()
+        if self.storage == 'dense':
+            self.count = np.array(self.count)
+            self.executor.release_memory()
+        if self.shared is not None:
+            self.hash_a = np.array(self.hash_a)
+            self.hash_b = np.array(self.hash_b)
+            self.shared.close()
+            self.shared = None
+
+    def share(self, name: str) -> None:
+        """
+        Moves the count tensor and hash parameters into a named shared memory segment,
+        with this sketch as its single writer. Readers in other processes can then
+        attach to the segment without copying the sketch.
+
+        Parameters:
+        - name (str): Name of the segment.
+        """
+        if self.storage != 'dense' or self.executor.uses_shared_memory():
+            raise ValueError("Only dense sketches that are not scored by worker processes can be shared.")
+
+        shared = SharedSketch.create(name, self.num_rows, self.num_buckets, self.count.dtype)
+        shared.hash_a[:] = self.hash_a
+        shared.hash_b[:] = self.hash_b
+        shared.count[...] = self.count
+        shared.header['scale'] = self.scale
+
+        self.hash_a, self.hash_b, self.count = shared.hash_a, shared.hash_b, shared.count
+        self.shared = shared
+
+    def attach(self, name: str) -> None:
+        """
+        Makes this sketch a read-only view of a segment created by share. The sketch must
+        have the same number of rows, buckets and dtype.
+
+        Parameters:
+        - name (str): Name of the segment.
+        """
+        shared = SharedSketch.attach(name)
+        if (shared.num_rows(), shared.num_buckets(), shared.dtype()) != (self.num_rows, self.num_buckets, self.count.dtype):
+            shared.close()
+            raise ValueError(f"Incompatible shared sketch {name}.")
+
+        self.hash_a, self.hash_b, self.count = shared.hash_a, shared.hash_b, shared.count
+        self.scale = shared.scale()
+        self.shared = shared
+        self.read_only = True
+
+    def _writing(self):
+        if self.read_only:
+            raise ValueError("This sketch is a read-only view of a shared sketch.")
+        return self.shared.writing(self) if self.shared is not None else contextlib.nullcontext()
+
+    def read_consistent(self, fn):
+        """
+        Calls fn and returns its result. On a reader attached to a shared sketch, fn is
+        called again if an update from the writer overlapped it, so fn must not change
+        any state. After READ_RETRIES overlapped calls, as with a writer updating
+        nonstop, fn runs on a private copy of the sketch taken by SharedSketch.snapshot.
+
+        Parameters:
+        - fn (Callable[[], Any]): Function reading the sketch.
+
+        Returns:
+        - Any: The result of fn.
+
+        Raises:
+        - TimeoutError: If an update of the writer never ends (see SharedSketch.begin_read).
+        """
+        if not self.read_only:
+            return fn()
+
+        for _ in range(self.READ_RETRIES):
+            seq = self.shared.begin_read()
+            self.scale = self.shared.scale()
+            result = fn()
+            if self.shared.validate_read(seq):
+                return result
+
+        # Copying a row is much shorter than scoring, so it fits between the updates.
+        shared_count = self.count
+        self.count, self.scale = self.shared.snapshot(self.READ_RETRIES)
+        try:
+            return fn()
+        finally:
+            self.count = shared_count
+
+    def save(self, directory: str) -> None:
+        """
+        Saves the sketch into a directory. A dense count tensor is written as a raw
+        count.npy file so that it can be memory-mapped when restored. Saving back to the
+        directory the sketch was restored from is supported.
+
+        Parameters:
+        - directory (str): Destination directory, created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        if self.storage == 'sparse':
+            cells = [(i, src, dst, value) for i, mat in enumerate(self.count.rows)
+                     for (src, dst), value in mat.cells.items()]
+            self._save_array(os.path.join(directory, 'count_index.npy'),
+                             np.array([cell[:3] for cell in cells], dtype=np.int64).reshape(-1, 3))
+            self._save_array(os.path.join(directory, 'count_values.npy'), np.array([cell[3] for cell in cells], dtype=float))
+        else:
+            self._save_array(os.path.join(directory, 'count.npy'), self.count)
+
+        state = {
+            'num_rows': self.num_rows,
+            'num_buckets': self.num_buckets,
+            'hash_a': self.hash_a.tolist(),
+            'hash_b': self.hash_b.tolist(),
+            'seed': self.seed,
+            'lazy_decay': self.lazy_decay,
+            'scale': self.scale,
+            'dtype': str(self.count.dtype),
+            'storage': self.storage,
+        }
+        with open(os.path.join(directory, 'hcms.json'), 'w') as file:
+            json.dump(state, file)
+
+    @staticmethod
+    def _save_array(path: str, array: np.ndarray) -> None:
+        # Writes a temporary file and renames it over path. The count tensor may be a
+        # memory map of path itself, restored from the same directory, and writing path
+        # in place would truncate the file backing it.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.save(file, array)
+        os.replace(tmp_path, path)
+
+    def restore(self, directory: str, mmap: bool = True) -> None:
+        """
+        Restores a sketch written by save. The sketch must have the same number of rows,
+        buckets, dtype and storage.
+
+        Parameters:
+        - directory (str): Directory written by save.
+        - mmap (bool): If True, a dense count tensor is memory-mapped copy-on-write, so
+          restoring is immediate and pages are only read when used. Otherwise it is read
+          into memory.
+        """
+        with open(os.path.join(directory, 'hcms.json'), 'r') as file:
+            state = json.load(file)
+
+        for key, value in (('num_rows', self.num_rows), ('num_buckets', self.num_buckets),
+                           ('dtype', str(self.count.dtype)), ('storage', self.storage)):
+            if state[key] != value:
+                raise ValueError(f"Incompatible snapshot: {key} is {state[key]}, expected {value}.")
+
+        self.hash_a = np.array(state['hash_a'], dtype=self.hash_a.dtype)
+        self.hash_b = np.array(state['hash_b'], dtype=self.hash_b.dtype)
+        self.seed = state.get('seed')
+        self.lazy_decay = state['lazy_decay']
+        self.scale = state['scale']
+
+        if self.storage == 'sparse':
+            index = np.load(os.path.join(directory, 'count_index.npy'))
+            values = np.load(os.path.join(directory, 'count_values.npy'))
+            self.count.fill(0)
+            for (i, src, dst), value in zip(index.tolist(), values.tolist()):
+                self.count[i].add(src, dst, value)
+            return
+
+        count = np.load(os.path.join(directory, 'count.npy'), mmap_mode='c' if mmap else None)
+        if self.executor.uses_shared_memory():
+            self.count[...] = count
+        else:
+            self.count = count
+
+    def merge(self, other: 'Hcms') -> None:
+        """
+        Adds the counts of another sketch into this one, e.g. to combine the sketches of
+        several collectors ingesting parts of the same stream. Both sketches must have
+        the same rows, buckets and hash functions (build them with the same seed), and
+        must have been decayed on the same schedule. Their lazy decay scales may differ,
+        the counts of other are converted to the scale of this sketch.
+
+        Parameters:
+        - other (Hcms): Sketch to add.
+        """
+        self._check_mergeable(other.num_rows, other.num_buckets, other.seed, other.hash_a, other.hash_b)
+        ratio = other.scale / self.scale
+        if not (np.isfinite(ratio) and ratio > 0):
+            raise ValueError(f"Incompatible sketches: decay scale {other.scale} cannot be merged into decay scale {self.scale}.")
+
+        if self.storage == 'dense' and other.storage == 'dense':
+            with self._writing():
+                values = other.count if ratio == 1.0 else other.count * ratio
+                np.add(self.count, values, out=self.count, casting='unsafe')
+            self._counts_merged()
+            return
+
+        flat_idx, values = other._nonzero_cells()
+        self._add_cells(flat_idx, values)
+
+    def to_delta(self, reset: bool = False) -> bytes:
+        """
+        Serializes the non-zero cells of the sketch into a compact delta that
+        merge_delta can add to a compatible sketch. The delta holds the hash
+        parameters, the flat index of every non-zero cell and its true (undecayed
+        by scale) value, compressed.
+
+        Parameters:
+        - reset (bool): If True, the sketch is cleared afterwards, so the next delta
+          only holds the edges inserted in between. Summing successive deltas then
+          rebuilds the whole sketch.
+
+        Returns:
+        - bytes: The serialized delta.
+        """
+        flat_idx, values = self._nonzero_cells()
+        num_cells = self.num_rows * self.num_buckets * self.num_buckets
+        index_dtype = np.uint32 if num_cells <= np.iinfo(np.uint32).max else np.int64
+        arrays = {
+            'shape': np.array([self.num_rows, self.num_buckets], dtype=np.int64),
+            'hash_a': self.hash_a,
+            'hash_b': self.hash_b,
+            'index': flat_idx.astype(index_dtype),
+            'values': values.astype(self.count.dtype),
+        }
+        if self.seed is not None:
+            arrays['seed'] = np.array(self.seed)
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        if reset:
+            self.clear()
+        return buffer.getvalue()
+
+    def merge_delta(self, delta: bytes) -> None:
+        """
+        Adds a delta written by to_delta into this sketch.
+
+        Parameters:
+        - delta (bytes): The serialized delta.
+        """
+        with np.load(io.BytesIO(delta), allow_pickle=False) as arrays:
+            num_rows, num_buckets = arrays['shape'].tolist()
+            seed = arrays['seed'].item() if 'seed' in arrays else None
+            self._check_mergeable(num_rows, num_buckets, seed, arrays['hash_a'], arrays['hash_b'])
+            flat_idx = arrays['index'].astype(np.int64)
+            values = arrays['values'].astype(float)
+        self._add_cells(flat_idx, values)
+
+    def _check_mergeable(self, num_rows: int, num_buckets: int, seed: int, hash_a: np.ndarray, hash_b: np.ndarray) -> None:
+        if (num_rows, num_buckets) != (self.num_rows, self.num_buckets):
+            raise ValueError(f"Incompatible sketches: {num_rows} rows and {num_buckets} buckets, "
+                             f"expected {self.num_rows} rows and {self.num_buckets} buckets.")
+        if seed is not None and self.seed is not None and seed != self.seed:
+            raise ValueError(f"Incompatible sketches: seed is {seed}, expected {self.seed}.")
+        if not (np.array_equal(hash_a, self.hash_a) and np.array_equal(hash_b, self.hash_b)):
+            raise ValueError("Incompatible sketches: the hash functions differ. Build both sketches with the same seed.")
+
+    def _nonzero_cells(self):
+        # Flat indices and true values (count * scale) of the non-zero cells.
+        if self.storage == 'sparse':
+            block = self.num_buckets * self.num_buckets
+            cells = [mat.flat_cells() for mat in self.count.rows]
+            flat_idx = np.concatenate([idx + i * block for i, (idx, _) in enumerate(cells)])
+            values = np.concatenate([values for _, values in cells])
+        else:
+            flat_count = self.count.reshape(-1)
+            flat_idx = np.flatnonzero(flat_count)
+            values = flat_count[flat_idx].astype(float)
+        return flat_idx, values * self.scale
+
+    def _add_cells(self, flat_idx: np.ndarray, values: np.ndarray) -> None:
+        # Adds true values to cells given by flat index.
+        with self._writing():
+            values = (values / self.scale).astype(self.count.dtype)
+            if self.storage == 'sparse':
+                rows, cells = np.divmod(flat_idx, self.num_buckets * self.num_buckets)
+                srcs, dsts = np.divmod(cells, self.num_buckets)
+                for i, src, dst, value in zip(rows.tolist(), srcs.tolist(), dsts.tolist(), values.tolist()):
+                    self.count[i].add(src, dst, value)
+            else:
+                np.add.at(self.count.reshape(-1), flat_idx, values)
+        self._counts_merged()
+
+    def _counts_merged(self) -> None:
+        # Hook for subclasses keeping state derived from the counts.
+        pass
+
+    def hash_many(self, elems: np.ndarray) -> np.ndarray:
+        """
+        Hashes an array of nodes with every hash function at once.
+
+        Parameters:
+        - elems (np.ndarray): Array of node ids.
+
+        Returns:
+        - np.ndarray: Array of shape (num_rows, len(elems)) holding the bucket of each node for each row.
+        """
+        if isinstance(elems, int):
+            # A single node, as in the per-edge calls of the detectors.
+            return ((self.hash_a * elems + self.hash_b) % self.num_buckets)[:, None]
+        elems = np.asarray(elems, dtype=np.int64).ravel()
+        return (self.hash_a[:, None] * elems[None, :] + self.hash_b[:, None]) % self.num_buckets
+
     def insert(self, source_node: int, destination_node: int, edge_weight: float):
         """
         Inserts a weighted edge value into the count matrix based on source and destination nodes.
@@ -40,10 +405,14 @@ class Hcms:
         - edge_weight (float): Weight of the edge to be inserted.
 
         """
-        source_buckets = np.array([self.hash(source_node, i) for i in range(self.num_rows)])
-        destination_buckets = np.array([self.hash(destination_node, i) for i in range(self.num_rows)])
+        source_buckets = self.hash_many(source_node)[:, 0]
+        destination_buckets = self.hash_many(destination_node)[:, 0]
 
-        self.count[np.arange(self.num_rows), source_buckets, destination_buckets] += edge_weight
+        with self._writing():
+            if self.storage == 'sparse':
+                self.count.add_at(source_buckets, destination_buckets, edge_weight / self.scale)
+                return
+            self.count[np.arange(self.num_rows), source_buckets, destination_buckets] += self.count.dtype.type(edge_weight / self.scale)
     
     def remove(self, source_node: int, destination_node: int, edge_weight: float):
         """
@@ -55,11 +424,81 @@ class Hcms:
         - edge_weight (float): Weight of the edge to be inserted.
 
         """
-        source_buckets = np.array([self.hash(source_node, i) for i in range(self.num_rows)])
-        destination_buckets = np.array([self.hash(destination_node, i) for i in range(self.num_rows)])
+        source_buckets = self.hash_many(source_node)[:, 0]
+        destination_buckets = self.hash_many(destination_node)[:, 0]
 
-        self.count[np.arange(self.num_rows), source_buckets, destination_buckets] -= edge_weight
+        with self._writing():
+            if self.storage == 'sparse':
+                self.count.add_at(source_buckets, destination_buckets, -edge_weight / self.scale)
+                return
+            self.count[np.arange(self.num_rows), source_buckets, destination_buckets] -= self.count.dtype.type(edge_weight / self.scale)
     
+    def insert_many(self, source_nodes: np.ndarray, destination_nodes: np.ndarray, edge_weights=1.0) -> None:
+        """
+        Inserts a batch of weighted edges into the count matrix.
+        Repeated edges within the batch are accumulated.
+
+        Parameters:
+        - source_nodes (np.ndarray): Source nodes.
+        - destination_nodes (np.ndarray): Destination nodes.
+        - edge_weights (float or np.ndarray): Weight of each edge, or a single weight shared by all edges.
+
+        """
+        self._scatter(np.add, source_nodes, destination_nodes, edge_weights)
+
+    def remove_many(self, source_nodes: np.ndarray, destination_nodes: np.ndarray, edge_weights=1.0) -> None:
+        """
+        Removes a batch of weighted edges from the count matrix.
+        Repeated edges within the batch are accumulated.
+
+        Parameters:
+        - source_nodes (np.ndarray): Source nodes.
+        - destination_nodes (np.ndarray): Destination nodes.
+        - edge_weights (float or np.ndarray): Weight of each edge, or a single weight shared by all edges.
+
+        """
+        self._scatter(np.subtract, source_nodes, destination_nodes, edge_weights)
+
+    def insert_buckets(self, source_buckets: np.ndarray, destination_buckets: np.ndarray, edge_weights=1.0) -> None:
+        """
+        Inserts a batch of weighted edges already hashed with hash_many, so callers that
+        also score the edges hash them only once.
+
+        Parameters:
+        - source_buckets (np.ndarray): Array of shape (num_rows, n) holding source buckets.
+        - destination_buckets (np.ndarray): Array of shape (num_rows, n) holding destination buckets.
+        - edge_weights (float or np.ndarray): Weight of each edge, or a single weight shared by all edges.
+
+        """
+        self._scatter_buckets(np.add, source_buckets, destination_buckets, edge_weights)
+
+    def _scatter(self, ufunc: np.ufunc, source_nodes: np.ndarray, destination_nodes: np.ndarray, edge_weights) -> None:
+        self._scatter_buckets(ufunc, self.hash_many(source_nodes), self.hash_many(destination_nodes), edge_weights)
+
+    def _scatter_buckets(self, ufunc: np.ufunc, source_buckets: np.ndarray, destination_buckets: np.ndarray, edge_weights) -> None:
+        if source_buckets.shape != destination_buckets.shape:
+            raise ValueError("source_nodes and destination_nodes must have the same length.")
+        num_edges = source_buckets.shape[1]
+
+        with self._writing():
+            weights = (np.asarray(edge_weights, dtype=float) / self.scale).astype(self.count.dtype)
+            if num_edges == 1 and self.storage != 'sparse':
+                # One cell per row, so plain indexing cannot repeat a cell.
+                idx = (np.arange(self.num_rows), source_buckets[:, 0], destination_buckets[:, 0])
+                self.count[idx] = ufunc(self.count[idx], weights.reshape(()))
+                return
+            weights = np.broadcast_to(weights, (num_edges,))
+
+            if self.storage == 'sparse':
+                sign = 1.0 if ufunc is np.add else -1.0
+                self.count.add_at(source_buckets, destination_buckets, sign * weights.astype(float))
+                return
+
+            # Scatter on the flattened tensor, which is much faster than a 3-index np.add.at.
+            rows = np.arange(self.num_rows)[:, None]
+            flat_idx = (rows * self.num_buckets + source_buckets) * self.num_buckets + destination_buckets
+            ufunc.at(self.count.reshape(-1), flat_idx.ravel(), np.broadcast_to(weights, flat_idx.shape).ravel())
+
     def get_count(self, source_node: int, destination_node: int) -> float:
         """
         Returns the minimum count value (an approximation of the weight of the edge) between source and destination nodes.
@@ -74,21 +513,544 @@ class Hcms:
 
         min_count = np.inf
 
-        a_buckets = np.array([self.hash(source_node, i) for i in range(self.num_rows)])
-        b_buckets = np.array([self.hash(destination_node, i) for i in range(self.num_rows)])
+        a_buckets = self.hash_many(source_node)[:, 0]
+        b_buckets = self.hash_many(destination_node)[:, 0]
+
+        if self.storage == 'sparse':
+            min_count = np.min(self.count.get_at(a_buckets, b_buckets))
+        else:
+            min_count = np.min(self.count[np.arange(self.num_rows), a_buckets, b_buckets])
+
+        return min_count * self.scale
+
+    def get_subgraph_density(self, mat: np.ndarray, src: int, dst: int, line_mass: np.ndarray = None) -> float:
+        """
+        Greedily expands a submatrix from the cell (src, dst), adding at each step the row
+        or column with the largest sum over the current submatrix, and returns the best
+        density seen. Ties go to the last index, as in a sequential scan.
+
+        Given the sums of all rows and columns of a non-negative matrix, the expansion
+        stops once even the heaviest lines left could not lift a later step above the
+        best density seen, which gives the same result in far fewer steps when the
+        matrix holds a dense submatrix.
+
+        Parameters:
+        - mat (np.ndarray): 2D array representing the matrix.
+        - src (int): Row of the starting cell.
+        - dst (int): Column of the starting cell.
+        - line_mass (np.ndarray): Sums of the rows of mat followed by the sums of its
+          columns, or None to run every step. Only valid if mat has no negative count.
+
+        Returns:
+        - float: Maximum density found during the expansion.
+        """
+        if isinstance(mat, SparseMatrix):
+            return self.get_subgraph_density_sparse(mat, src, dst)
+
+        num_rows, num_cols = mat.shape
+
+        row_flag = np.zeros(num_rows, dtype=bool)
+        col_flag = np.zeros(num_cols, dtype=bool)
 
-        min_count = np.min(self.count[np.arange(self.num_rows), a_buckets, b_buckets])
+        # Slice sums of marked rows/columns are set to -inf so they are never selected.
+        row_slice_sum = mat[:, dst].astype(float)
+        col_slice_sum = mat[src, :].astype(float)
 
-        return min_count
+        row_flag[src] = True
+        col_flag[dst] = True
+        row_slice_sum[src] = -np.inf
+        col_slice_sum[dst] = -np.inf
+
+        max_row = self._find_last_max(row_slice_sum)
+        max_col = self._find_last_max(col_slice_sum)
+
+        marked_rows = 1
+        marked_cols = 1
+
+        cur_mat_sum = float(mat[src, dst])
+        output = cur_mat_sum / np.sqrt(marked_rows * marked_cols)
+
+        if line_mass is not None:
+            # Lines from the heaviest down, to bound what the next steps can add.
+            line_order = np.argsort(line_mass)[::-1]
+            sorted_mass = np.asarray(line_mass, dtype=float)[line_order]
+
+        ctr = num_rows + num_cols - 2
+        while ctr > 0:
+            if line_mass is not None and ctr % self.STOP_CHECK == 0:
+                # k more lines add at most the k heaviest lines left, and give the
+                # submatrix at least min(R * (C + k), (R + k) * C) cells.
+                left = np.cumsum(sorted_mass[~np.concatenate((row_flag, col_flag))[line_order]])
+                k = np.arange(1, len(left) + 1)
+                size = np.minimum(marked_rows * (marked_cols + k), (marked_rows + k) * marked_cols)
+                if np.max((cur_mat_sum + left) / np.sqrt(size)) <= output * (1 - 1e-9):
+                    break
+
+            if max_row[1] >= max_col[1]:
+                row_flag[max_row[0]] = True
+                row_slice_sum[max_row[0]] = -np.inf
+                marked_rows += 1
+
+                cur_mat_sum = self._sequential_sum(cur_mat_sum, mat[max_row[0], col_flag])
+                col_slice_sum += mat[max_row[0], :]
+            else:
+                col_flag[max_col[0]] = True
+                col_slice_sum[max_col[0]] = -np.inf
+                marked_cols += 1
+
+                cur_mat_sum = self._sequential_sum(cur_mat_sum, mat[row_flag, max_col[0]])
+                row_slice_sum += mat[:, max_col[0]]
+
+            max_row = self._find_last_max(row_slice_sum)
+            max_col = self._find_last_max(col_slice_sum)
+
+            output = max(output, cur_mat_sum / np.sqrt(marked_rows * marked_cols))
+            ctr -= 1
+
+        return output
+
+    def get_subgraph_density_batch(self, mat: np.ndarray, srcs: np.ndarray, dsts: np.ndarray) -> np.ndarray:
+        """
+        Runs the greedy expansion of get_subgraph_density from several starting cells at
+        once. Every expansion takes the same number of steps, so each step is evaluated
+        for all seeds with a few NumPy calls. Results are bit-identical to calling
+        get_subgraph_density once per seed.
+
+        Parameters:
+        - mat (np.ndarray): 2D array representing the matrix.
+        - srcs (np.ndarray): Rows of the starting cells.
+        - dsts (np.ndarray): Columns of the starting cells.
+
+        Returns:
+        - np.ndarray: Maximum density found for each starting cell.
+        """
+        if isinstance(mat, SparseMatrix):
+            return np.array([self.get_subgraph_density_sparse(mat, src, dst)
+                             for src, dst in zip(np.asarray(srcs).tolist(), np.asarray(dsts).tolist())])
+
+        num_rows, num_cols = mat.shape
+        srcs = np.asarray(srcs, dtype=np.int64)
+        dsts = np.asarray(dsts, dtype=np.int64)
+        seeds = np.arange(len(srcs))
+
+        row_flag = np.zeros((len(seeds), num_rows), dtype=bool)
+        col_flag = np.zeros((len(seeds), num_cols), dtype=bool)
+
+        row_slice_sum = mat[:, dsts].T.astype(float)
+        col_slice_sum = mat[srcs, :].astype(float)
+
+        row_flag[seeds, srcs] = True
+        col_flag[seeds, dsts] = True
+        row_slice_sum[seeds, srcs] = -np.inf
+        col_slice_sum[seeds, dsts] = -np.inf
+
+        max_row_idx, max_row_val = self._find_last_max_batch(row_slice_sum)
+        max_col_idx, max_col_val = self._find_last_max_batch(col_slice_sum)
+
+        marked_rows = np.ones(len(seeds))
+        marked_cols = np.ones(len(seeds))
+
+        cur_mat_sum = mat[srcs, dsts].astype(float)
+        output = cur_mat_sum / np.sqrt(marked_rows * marked_cols)
+
+        ctr = num_rows + num_cols - 2
+        while ctr > 0:
+            add_row = max_row_val >= max_col_val
+
+            row_seeds = seeds[add_row]
+            if len(row_seeds) > 0:
+                new_rows = max_row_idx[add_row]
+                row_flag[row_seeds, new_rows] = True
+                row_slice_sum[row_seeds, new_rows] = -np.inf
+                marked_rows[row_seeds] += 1
+
+                # Unmarked columns contribute exact zeros to the sequential sum.
+                new_cells = mat[new_rows, :] * col_flag[row_seeds]
+                cur_mat_sum[row_seeds] = self._sequential_sum_batch(cur_mat_sum[row_seeds], new_cells)
+                col_slice_sum[row_seeds] += mat[new_rows, :]
+
+            col_seeds = seeds[~add_row]
+            if len(col_seeds) > 0:
+                new_cols = max_col_idx[~add_row]
+                col_flag[col_seeds, new_cols] = True
+                col_slice_sum[col_seeds, new_cols] = -np.inf
+                marked_cols[col_seeds] += 1
+
+                new_cells = mat[:, new_cols].T * row_flag[col_seeds]
+                cur_mat_sum[col_seeds] = self._sequential_sum_batch(cur_mat_sum[col_seeds], new_cells)
+                row_slice_sum[col_seeds] += mat[:, new_cols].T
+
+            max_row_idx, max_row_val = self._find_last_max_batch(row_slice_sum)
+            max_col_idx, max_col_val = self._find_last_max_batch(col_slice_sum)
+
+            output = np.maximum(output, cur_mat_sum / np.sqrt(marked_rows * marked_cols))
+            ctr -= 1
+
+        return output
+
+    def get_subgraph_density_sparse(self, mat: SparseMatrix, src: int, dst: int) -> float:
+        """
+        Sparse version of get_subgraph_density, giving the same result for non-negative
+        counts. Slice sums are only updated for non-zero cells and the best candidates are
+        kept in heaps. Zero-sum candidates are taken from the highest index down, like the
+        last-index tie break of the dense kernel. The expansion stops once no mass is left
+        to add, since the density can then only decrease.
+
+        Parameters:
+        - mat (SparseMatrix): Sparse matrix.
+        - src (int): Row of the starting cell.
+        - dst (int): Column of the starting cell.
+
+        Returns:
+        - float: Maximum density found during the expansion.
+        """
+        num_rows, num_cols = mat.shape
+
+        row_flag = np.zeros(num_rows, dtype=bool)
+        col_flag = np.zeros(num_cols, dtype=bool)
+        row_slice_sum = np.zeros(num_rows)
+        col_slice_sum = np.zeros(num_cols)
+
+        row_flag[src] = True
+        col_flag[dst] = True
+
+        # Heap entries are (-sum, -index) so the largest sum, then the largest index, comes first.
+        row_heap = []
+        col_heap = []
+        # Candidates with a zero sum are scanned from the highest index down.
+        zero_ptr = [num_rows - 1, num_cols - 1]
+
+        rows, values = mat.nonzero_in_col(dst)
+        for row, value in zip(rows.tolist(), values.tolist()):
+            if row != src:
+                row_slice_sum[row] = value
+                heapq.heappush(row_heap, (-value, -row))
+        cols, values = mat.nonzero_in_row(src)
+        for col, value in zip(cols.tolist(), values.tolist()):
+            if col != dst:
+                col_slice_sum[col] = value
+                heapq.heappush(col_heap, (-value, -col))
+
+        # Number of non-zero cells outside the marked rows and columns.
+        uncovered = mat.nnz() - len(rows) - len(cols) + (1 if mat.get(src, dst) != 0 else 0)
+
+        def find_max(heap, slice_sum, flag, side):
+            while heap and (flag[-heap[0][1]] or -heap[0][0] != slice_sum[-heap[0][1]]):
+                heapq.heappop(heap)
+            if heap:
+                return (-heap[0][1], -heap[0][0])
+            while zero_ptr[side] >= 0 and (flag[zero_ptr[side]] or slice_sum[zero_ptr[side]] != 0):
+                zero_ptr[side] -= 1
+            return (zero_ptr[side], 0.0) if zero_ptr[side] >= 0 else (-1, -1.0)
+
+        max_row = find_max(row_heap, row_slice_sum, row_flag, 0)
+        max_col = find_max(col_heap, col_slice_sum, col_flag, 1)
+
+        marked_rows = 1
+        marked_cols = 1
+
+        cur_mat_sum = float(mat.get(src, dst))
+        output = cur_mat_sum / np.sqrt(marked_rows * marked_cols)
+
+        ctr = num_rows + num_cols - 2
+        while ctr > 0:
+            if max_row[1] >= max_col[1]:
+                row_flag[max_row[0]] = True
+                marked_rows += 1
+
+                cols, values = mat.nonzero_in_row(max_row[0])
+                for col, value in zip(cols.tolist(), values.tolist()):
+                    if col_flag[col]:
+                        cur_mat_sum += value
+                    else:
+                        col_slice_sum[col] += value
+                        heapq.heappush(col_heap, (-col_slice_sum[col], -col))
+                        uncovered -= 1
+            else:
+                col_flag[max_col[0]] = True
+                marked_cols += 1
+
+                rows, values = mat.nonzero_in_col(max_col[0])
+                for row, value in zip(rows.tolist(), values.tolist()):
+                    if row_flag[row]:
+                        cur_mat_sum += value
+                    else:
+                        row_slice_sum[row] += value
+                        heapq.heappush(row_heap, (-row_slice_sum[row], -row))
+                        uncovered -= 1
+
+            max_row = find_max(row_heap, row_slice_sum, row_flag, 0)
+            max_col = find_max(col_heap, col_slice_sum, col_flag, 1)
+
+            output = max(output, cur_mat_sum / np.sqrt(marked_rows * marked_cols))
+            ctr -= 1
+
+            if uncovered == 0 and max_row[1] <= 0 and max_col[1] <= 0:
+                break
+
+        return output
+
+    def peel(self, mat: np.ndarray):
+        """
+        Peels a matrix by repeatedly removing the row or column with the smallest sum,
+        and returns the best density seen with the rows and columns left at that point.
+        This is the 2-approximation of the densest submatrix used by AnoGraph.
+
+        Parameters:
+        - mat (np.ndarray): 2D array representing the matrix.
+
+        Returns:
+        - Tuple[float, np.ndarray, np.ndarray]: Maximum density, and boolean masks of the
+          rows and columns of the submatrix reaching it.
+        """
+        if isinstance(mat, SparseMatrix):
+            return self.peel_sparse(mat)
+
+        num_rows, num_cols = mat.shape
+        
+        row_flag = np.ones(num_rows, dtype=bool)
+        col_flag = np.ones(num_cols, dtype=bool)
+
+        row_sum = np.sum(mat, axis = 1, dtype=float)
+        col_sum = np.sum(mat, axis = 0, dtype=float)
+
+        marked_row = num_rows
+        marked_col = num_cols
+
+        total_sum = np.sum(row_sum)
+        current_density = total_sum/np.sqrt(marked_row * marked_row)
+        output = current_density
+
+        # Removed (is_row, index) in order, and how many were removed at the best density.
+        removed = []
+        best = 0
+
+        for _ in range(num_rows + num_cols):
+            
+            min_row_idx = np.argmin(row_sum)
+
+            min_col_idx = np.argmin(col_sum)
+
+            if row_sum[min_row_idx] <= col_sum[min_col_idx]:
+                row_flag[min_row_idx] = False
+                row_sum[min_row_idx] = np.inf
+                col_sum -= mat[min_row_idx,:]
+                total_sum -= np.sum(mat[min_row_idx, col_flag], dtype=float)
+                marked_row -= 1
+                removed.append((True, min_row_idx))
+            else:
+                col_flag[min_col_idx] =False
+                col_sum[min_col_idx] = np.inf
+                row_sum -= mat[:, min_col_idx]
+                total_sum -= np.sum(mat[row_flag, min_col_idx], dtype=float)
+                marked_col -= 1
+                removed.append((False, min_col_idx))
+            
+            if marked_col == 0 or marked_row == 0:
+                break
+            
+            current_density = total_sum/np.sqrt(marked_row * marked_col)
+
+            if current_density > output:
+                output = current_density
+                best = len(removed)
+            
+        return (output,) + self._peeled_masks(num_rows, num_cols, removed[:best])
+
+    def peel_sparse(self, mat: SparseMatrix):
+        """
+        Sparse version of peel, keeping the row and column sums in min-heaps. Removing a
+        row or column only touches its non-zero cells, so the cost follows the number of
+        non-zero cells and the b x b matrix is never built. On dense matrices the per-cell
+        heap updates run in Python and are several times slower than peel.
+
+        Parameters:
+        - mat (SparseMatrix): 2D sparse matrix.
+
+        Returns:
+        - Tuple[float, np.ndarray, np.ndarray]: Maximum density, and boolean masks of the
+          rows and columns of the submatrix reaching it.
+        """
+        num_rows, num_cols = mat.shape
+
+        row_removed = np.zeros(num_rows, dtype=bool)
+        col_removed = np.zeros(num_cols, dtype=bool)
+
+        row_sum = mat.row_sums()
+        col_sum = mat.col_sums()
+
+        # Heap entries are (sum, index); entries whose sum is outdated are skipped when popped.
+        row_heap = list(zip(row_sum.tolist(), range(num_rows)))
+        col_heap = list(zip(col_sum.tolist(), range(num_cols)))
+        heapq.heapify(row_heap)
+        heapq.heapify(col_heap)
+
+        marked_row = num_rows
+        marked_col = num_cols
+
+        total_sum = np.sum(row_sum)
+        output = total_sum/np.sqrt(marked_row * marked_row)
+
+        removed = []
+        best = 0
+
+        for _ in range(num_rows + num_cols):
+            while row_removed[row_heap[0][1]] or row_heap[0][0] != row_sum[row_heap[0][1]]:
+                heapq.heappop(row_heap)
+            while col_removed[col_heap[0][1]] or col_heap[0][0] != col_sum[col_heap[0][1]]:
+                heapq.heappop(col_heap)
+
+            if row_heap[0][0] <= col_heap[0][0]:
+                min_row_sum, min_row_idx = heapq.heappop(row_heap)
+                row_removed[min_row_idx] = True
+                total_sum -= min_row_sum
+                marked_row -= 1
+                removed.append((True, min_row_idx))
+
+                nonzero, values = mat.nonzero_in_row(min_row_idx)
+                keep = ~col_removed[nonzero]
+                nonzero = nonzero[keep]
+                col_sum[nonzero] -= values[keep]
+                for idx, value in zip(nonzero.tolist(), col_sum[nonzero].tolist()):
+                    heapq.heappush(col_heap, (value, idx))
+            else:
+                min_col_sum, min_col_idx = heapq.heappop(col_heap)
+                col_removed[min_col_idx] = True
+                total_sum -= min_col_sum
+                marked_col -= 1
+                removed.append((False, min_col_idx))
+
+                nonzero, values = mat.nonzero_in_col(min_col_idx)
+                keep = ~row_removed[nonzero]
+                nonzero = nonzero[keep]
+                row_sum[nonzero] -= values[keep]
+                for idx, value in zip(nonzero.tolist(), row_sum[nonzero].tolist()):
+                    heapq.heappush(row_heap, (value, idx))
+
+            if marked_col == 0 or marked_row == 0:
+                break
+
+            current_density = total_sum/np.sqrt(marked_row * marked_col)
+            if current_density > output:
+                output = current_density
+                best = len(removed)
+
+        return (output,) + self._peeled_masks(num_rows, num_cols, removed[:best])
+
+    @staticmethod
+    def get_top_k_cells(mat: np.ndarray, K: int) -> np.ndarray:
+        """
+        Selects the K largest cells of a matrix without sorting it. Ties are broken
+        in favour of the lowest flat index, like a stable descending sort.
+
+        Parameters:
+        - mat (np.ndarray): 2D array representing the matrix.
+        - K (int): Number of cells to select.
+
+        Returns:
+        - np.ndarray: Flat indices of the selected cells.
+        """
+        if isinstance(mat, SparseMatrix):
+            return Hcms._get_top_k_cells_sparse(mat, K)
+
+        flat_mat = mat.ravel()
+        K = min(K, len(flat_mat))
+        if K <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        threshold = np.partition(flat_mat, len(flat_mat) - K)[len(flat_mat) - K]
+        above = np.flatnonzero(flat_mat > threshold)
+        ties = np.flatnonzero(flat_mat == threshold)[:K - len(above)]
+        return np.concatenate((above, ties))
+
+    @staticmethod
+    def _get_top_k_cells_sparse(mat: SparseMatrix, K: int) -> np.ndarray:
+        # Stored cells are positive, so they come before every empty cell.
+        flat_idx, values = mat.flat_cells()
+        K = min(K, mat.shape[0] * mat.shape[1])
+        if K <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        if K <= len(values):
+            threshold = np.partition(values, len(values) - K)[len(values) - K]
+            above = flat_idx[values > threshold]
+            ties = flat_idx[values == threshold][:K - len(above)]
+            return np.concatenate((above, ties))
+
+        stored = set(flat_idx.tolist())
+        empty = []
+        idx = 0
+        while len(empty) < K - len(values):
+            if idx not in stored:
+                empty.append(idx)
+            idx += 1
+        return np.concatenate((flat_idx, np.array(empty, dtype=np.int64)))
+
+    @staticmethod
+    def _peeled_masks(num_rows: int, num_cols: int, removed: list):
+        # Rows and columns left after the given removals.
+        row_mask = np.ones(num_rows, dtype=bool)
+        col_mask = np.ones(num_cols, dtype=bool)
+        for is_row, idx in removed:
+            (row_mask if is_row else col_mask)[idx] = False
+        return row_mask, col_mask
+
+    @staticmethod
+    def _find_last_max_batch(slice_sum: np.ndarray):
+        # Row-wise version of _find_last_max.
+        idx = slice_sum.shape[1] - 1 - np.argmax(slice_sum[:, ::-1], axis=1)
+        val = slice_sum[np.arange(len(slice_sum)), idx]
+        exhausted = ~(val >= -1.0)
+        idx[exhausted] = -1
+        val[exhausted] = -1.0
+        return idx, val
+
+    @staticmethod
+    def _sequential_sum_batch(start: np.ndarray, values: np.ndarray) -> np.ndarray:
+        # Row-wise version of _sequential_sum.
+        return np.cumsum(np.concatenate((start[:, None], values), axis=1), axis=1)[:, -1]
+
+    @staticmethod
+    def _find_last_max(slice_sum: np.ndarray):
+        # Last index of the maximum, or (-1, -1.0) when nothing selectable is left.
+        idx = len(slice_sum) - 1 - int(np.argmax(slice_sum[::-1]))
+        if not slice_sum[idx] >= -1.0:
+            return (-1, -1.0)
+        return (idx, slice_sum[idx])
+
+    @staticmethod
+    def _sequential_sum(start: float, values: np.ndarray) -> float:
+        # cumsum adds left to right, matching a Python accumulation loop bit for bit.
+        return np.cumsum(np.concatenate(([start], values)))[-1]
 
     def decay(self, decay_factor: float) -> None:
         """
         Decays the count values and optionally decays the densest_matrices using NumPy operations.
+        With lazy decay only the scale factor is updated, and the count tensor is
+        renormalized once the scale leaves [MIN_SCALE, MAX_SCALE].
 
         Parameters:
         - decay_factor (float): Factor to decay the count values.
         """
-        self.count *= decay_factor
+        if not np.issubdtype(self.count.dtype, np.floating):
+            raise TypeError(f"Counts of dtype {self.count.dtype} cannot be decayed.")
+
+        with self._writing():
+            if not self.lazy_decay:
+                self.count *= decay_factor
+                return
+
+            self.scale *= decay_factor
+            if not self.MIN_SCALE <= self.scale <= self.MAX_SCALE:
+                self.renormalize()
+
+    def renormalize(self) -> None:
+        """
+        Folds the lazy decay scale into the count tensor and resets it to 1.
+        """
+        with self._writing():
+            self.count *= self.scale
+            self.scale = 1.0
 
     
     
@@ -1,19 +1,155 @@
-from submatrix import Submatrix
 from hcms import Hcms
+from sparsecount import SparseMatrix
 import numpy as np
 
 class HcmsAnoedgeGlobal(Hcms):
-    def __init__(self, r: int, b: int):
+    def __init__(self, r: int, b: int, lazy_decay: bool = False, workers: int = 1, executor: str = 'thread',
+                 dtype=np.float64, storage: str = 'dense', seed: int = None, staleness: float = 0.0):
         """
         Initializes an Hcms object.
 
+        With staleness > 0, every row caches the density get_anoedgeglobal_density gives
+        for each seed cell it was asked for, and keeps its row and column sums, the
+        marginals, up to date on every insert. Once the mass inserted into or removed from
+        a row exceeds staleness times its mass M when its cache was started, the cache is
+        dropped and its seeds are expanded again. So the density a row gives an edge is
+        exactly get_anoedgeglobal_density on counts that differ from the current ones by
+        at most staleness * M in total, and the submatrix it was found on has a current
+        density within staleness * M of it, as a density moves by no more than its sum.
+        Decay scales the cache with the counts. Dense expansions stop early using the
+        marginals (see Hcms.get_subgraph_density), so a new seed costs a few steps when
+        the row holds a dense submatrix.
+
         Parameters:
         - r (int): Number of rows.
         - b (int): Number of buckets
+        - lazy_decay (bool): If True, decay only updates a global scale factor.
+        - workers (int): Number of workers used to score the rows concurrently.
+        - executor (str): Kind of workers, either thread or process.
+        - dtype: Data type of the count tensor.
+        - storage (str): Storage of the count tensor, either dense or sparse.
+        - seed (int): Seed of the hash functions.
+        - staleness (float): Fraction of the row mass that may change before the cached
+          densities of the row are dropped. As it goes to 0, every row is expanded again
+          for every edge and scores are exact. 0 runs the plain greedy expansion.
 
         """
-        super().__init__(r, b)
-    
+        if staleness < 0:
+            raise ValueError(f"Invalid value: {staleness}. staleness must be non-negative.")
+        super().__init__(r, b, lazy_decay, workers, executor, dtype, storage, seed)
+        self.staleness = staleness
+        self.reset_density_cache()
+
+    def reset_density_cache(self) -> None:
+        """
+        Drops the cached densities, so every row is expanded again when next scored.
+        """
+        # Cached densities and masses are stored divided by cache_scale, the factor
+        # applied to the count tensor since the reset, so decay leaves them valid.
+        self.cache_scale = 1.0
+        if self.staleness == 0:
+            return
+        r, b = self.num_rows, self.num_buckets
+        # Densities of the current cache of every row, by seed cell.
+        self.density_cache = [{} for _ in range(r)]
+        # Marginals are only read from the counts when a row starts a cache, so a
+        # restored sketch is not scanned until it is scored.
+        self.cache_valid = np.zeros(r, dtype=bool)
+        self.row_mass = np.zeros((r, b))
+        self.col_mass = np.zeros((r, b))
+        self.cache_mass = np.zeros(r)
+        self.mass_change = np.zeros(r)
+        # Rows with a negative count, where the marginals cannot stop an expansion.
+        self.negative = np.zeros(r, dtype=bool)
+
+    def _track_cells(self, source_buckets: np.ndarray, destination_buckets: np.ndarray, weights: np.ndarray) -> None:
+        # Applies signed weights, in units of the count tensor, to the marginals.
+        # source_buckets and destination_buckets have shape (r, n), weights shape (n,).
+        if self.staleness == 0:
+            return
+        weights = weights / self.cache_scale
+        rows = np.broadcast_to(np.arange(self.num_rows)[:, None], source_buckets.shape)
+        np.add.at(self.row_mass, (rows, source_buckets), weights)
+        np.add.at(self.col_mass, (rows, destination_buckets), weights)
+        self.mass_change += np.sum(np.abs(weights))
+        if self.storage == 'dense' and np.any(weights < 0):
+            self.negative |= np.any(self.count[rows, source_buckets, destination_buckets] < 0, axis=1)
+
+    def insert(self, source_node: int, destination_node: int, edge_weight: float):
+        super().insert(source_node, destination_node, edge_weight)
+        if self.staleness > 0:
+            self._track_cells(self.hash_many(source_node), self.hash_many(destination_node),
+                              np.array([edge_weight / self.scale]))
+
+    def remove(self, source_node: int, destination_node: int, edge_weight: float):
+        super().remove(source_node, destination_node, edge_weight)
+        if self.staleness > 0:
+            self._track_cells(self.hash_many(source_node), self.hash_many(destination_node),
+                              np.array([-edge_weight / self.scale]))
+
+    def _scatter_buckets(self, ufunc: np.ufunc, source_buckets: np.ndarray, destination_buckets: np.ndarray, edge_weights) -> None:
+        super()._scatter_buckets(ufunc, source_buckets, destination_buckets, edge_weights)
+        if self.staleness > 0:
+            source_buckets = np.asarray(source_buckets).reshape(self.num_rows, -1)
+            destination_buckets = np.asarray(destination_buckets).reshape(self.num_rows, -1)
+            weights = np.broadcast_to(np.asarray(edge_weights, dtype=float), source_buckets.shape[1:])
+            sign = 1.0 if ufunc is np.add else -1.0
+            self._track_cells(source_buckets, destination_buckets, sign * weights / self.scale)
+
+    def _counts_merged(self) -> None:
+        self.reset_density_cache()
+
+    def clear(self) -> None:
+        super().clear()
+        self.reset_density_cache()
+
+    def restore(self, directory: str, mmap: bool = True) -> None:
+        super().restore(directory, mmap)
+        self.reset_density_cache()
+
+    def attach(self, name: str) -> None:
+        if self.staleness > 0:
+            raise ValueError("A read-only sketch does not see the inserts of the writer, so it cannot use staleness.")
+        super().attach(name)
+
+    def decay(self, decay_factor: float) -> None:
+        super().decay(decay_factor)
+        if not self.lazy_decay:
+            self.cache_scale *= decay_factor
+
+    def renormalize(self) -> None:
+        self.cache_scale *= self.scale
+        super().renormalize()
+
+    def _start_cache(self, i: int) -> None:
+        # Drops the cached densities of row i and reads its marginals from the counts.
+        mat = self.count[i]
+        if isinstance(mat, SparseMatrix):
+            flat_idx, values = mat.flat_cells()
+            src, dst = np.divmod(flat_idx, self.num_buckets)
+            row_mass = np.bincount(src, weights=values, minlength=self.num_buckets)
+            col_mass = np.bincount(dst, weights=values, minlength=self.num_buckets)
+            negative = bool(np.any(values < 0))
+        else:
+            row_mass = mat.sum(axis=1, dtype=float)
+            col_mass = mat.sum(axis=0, dtype=float)
+            negative = bool(np.min(mat) < 0)
+        self.density_cache[i] = {}
+        self.row_mass[i] = row_mass / self.cache_scale
+        self.col_mass[i] = col_mass / self.cache_scale
+        self.cache_mass[i] = np.sum(row_mass) / self.cache_scale
+        self.mass_change[i] = 0.0
+        self.negative[i] = negative
+        self.cache_valid[i] = True
+
+    def _expand(self, i: int, src: int, dst: int) -> None:
+        # Caches the greedy density of row i around (src, dst), stopped early by the marginals.
+        line_mass = None
+        if not self.negative[i]:
+            line_mass = np.concatenate((self.row_mass[i], self.col_mass[i])) * self.cache_scale
+        density = self.get_subgraph_density(self.count[i], src, dst, line_mass)
+        self.density_cache[i][(src, dst)] = density / self.cache_scale
+
     def find_max(self, slice_sum, flag):
 
         indices = np.where(~flag)[0]
@@ -24,76 +160,18 @@ class HcmsAnoedgeGlobal(Hcms):
 
 
     def get_anoedgeglobal_density(self, mat: np.ndarray, src: int, dst: int) -> float:
-        num_rows, num_cols = mat.shape
-
-        row_flag = np.full(num_rows, False)
-        col_flag = np.full(num_cols, False)
-
-        row_slice_sum = mat[:, dst].copy()
-        col_slice_sum = mat[src, :].copy()
-
-        row_flag[src] = True
-        col_flag[dst] = True
-        row_slice_sum[src] = mat[src, dst]
-        col_slice_sum[dst] = mat[src, dst]
-
-        max_row = (-1, -1.0)
-        for i in range(num_rows):
-            if not row_flag[i] and row_slice_sum[i] >= max_row[1]:
-                max_row = (i, row_slice_sum[i])
-
-        max_col = (-1, -1.0)
-        for i in range(num_cols):
-            if not col_flag[i] and col_slice_sum[i] >= max_col[1]:
-                max_col = (i, col_slice_sum[i])
-
-        marked_rows = 1
-        marked_cols = 1
-
-        cur_mat_sum = mat[src, dst]
-        output = cur_mat_sum / np.sqrt(marked_rows * marked_cols)
-
-        ctr = num_rows + num_cols - 2
-        while ctr > 0:
-            if max_row[1] >= max_col[1]:
-                row_flag[max_row[0]] = True
-                marked_rows += 1
-
-                max_col = (-1, -1.0)
-                for i in range(num_cols):
-                    if col_flag[i]:
-                        cur_mat_sum += mat[max_row[0], i]
-                    else:
-                        col_slice_sum[i] += mat[max_row[0], i]
-                        if col_slice_sum[i] >= max_col[1]:
-                            max_col = (i, col_slice_sum[i])
-
-                max_row = (-1, -1.0)
-                for i in range(num_rows):
-                    if not row_flag[i] and row_slice_sum[i] >= max_row[1]:
-                        max_row = (i, row_slice_sum[i])
-            else:
-                col_flag[max_col[0]] = True
-                marked_cols += 1
-
-                max_row = (-1, -1.0)
-                for i in range(num_rows):
-                    if row_flag[i]:
-                        cur_mat_sum += mat[i, max_col[0]]
-                    else:
-                        row_slice_sum[i] += mat[i, max_col[0]]
-                        if row_slice_sum[i] >= max_row[1]:
-                            max_row = (i, row_slice_sum[i])
-
-                max_col = (-1, -1.0)
-                for i in range(num_cols):
-                    if not col_flag[i] and col_slice_sum[i] >= max_col[1]:
-                        max_col = (i, col_slice_sum[i])
-
-            output = max(output, cur_mat_sum / np.sqrt(marked_rows * marked_cols))
-            ctr -= 1
-
-        return output
+        """
+        Computes the density of the dense submatrix greedily grown around (src, dst).
+
+        Parameters:
+        - mat (np.ndarray): 2D array representing the matrix.
+        - src (int): Source bucket.
+        - dst (int): Destination bucket.
+
+        Returns:
+        - float: Maximum density found during the expansion.
+        """
+        return self.get_subgraph_density(mat, src, dst)
 
     
     def get_anoedgeglobal_score(self, src: int, dst: int) -> float:
@@ -107,12 +185,29 @@ class HcmsAnoedgeGlobal(Hcms):
         Returns:
         - float: Minimum dsubgraph value.
         """
-        min_dsubgraph = float('inf')
+        return self.get_anoedgeglobal_bucket_score(self.hash_many(src)[:, 0].tolist(), self.hash_many(dst)[:, 0].tolist())
+
+    def get_anoedgeglobal_bucket_score(self, src_buckets: list, dst_buckets: list) -> float:
+        """
+        Computes the minimum dsubgraph value of an edge already hashed with hash_many.
+
+        Parameters:
+        - src_buckets (list): Bucket of the source node in each row.
+        - dst_buckets (list): Bucket of the destination node in each row.
+
+        Returns:
+        - float: Minimum dsubgraph value.
+        """
+        row_args = list(zip(src_buckets, dst_buckets))
+        if self.staleness == 0:
+            densities = self.executor.map_kernel(self, 'get_anoedgeglobal_density', self.count, row_args)
+            return min(densities) * self.scale
+
+        stale = np.flatnonzero(~self.cache_valid | (self.mass_change > self.staleness * self.cache_mass)).tolist()
+        self.executor.map(lambda k: self._start_cache(stale[k]), len(stale))
 
-        for i in range(self.num_rows):
-            src_bucket = self.hash(src, i)
-            dst_bucket = self.hash(dst, i)
-            cur_dsubgraph = self.get_anoedgeglobal_density(self.count[i], src_bucket, dst_bucket)
-            min_dsubgraph = min(min_dsubgraph, cur_dsubgraph)
+        missing = [i for i in range(self.num_rows) if row_args[i] not in self.density_cache[i]]
+        self.executor.map(lambda k: self._expand(missing[k], *row_args[missing[k]]), len(missing))
 
-        return min_dsubgraph
\ No newline at end of file
+        densities = [self.density_cache[i][row_args[i]] for i in range(self.num_rows)]
+        return min(densities) * self.cache_scale * self.scale
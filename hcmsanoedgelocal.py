@@ -1,22 +1,37 @@
-from submatrix import Submatrix
+from submatrixstack import SubmatrixStack
 from hcms import Hcms
 import numpy as np
+import json
+import os
 
 class HcmsAnoedgeLocal(Hcms):
-    def __init__(self, r: int, b: int, d : int):
+    def __init__(self, r: int, b: int, d : int, lazy_decay: bool = False, dtype=np.float64, storage: str = 'dense',
+                 seed: int = None):
         """
         Initializes an Hcms object.
 
         Parameters:
         - r (int): Number of rows.
         - b (int): Number of buckets.
-        - d (int): Number of dense submatrices
+        - d (int): Number of dense submatrices of each row. The submatrices of all rows are
+          updated together with NumPy, see SubmatrixStack.
+        - lazy_decay (bool): If True, decay only updates a global scale factor.
+        - dtype: Data type of the count tensor.
+        - storage (str): Storage of the count tensor, either dense or sparse.
+        - seed (int): Seed of the hash functions.
 
         """
-        super().__init__(r, b)
+        super().__init__(r, b, lazy_decay, 1, 'thread', dtype, storage, seed)
         self.num_dense_submatrices = d
-        self.densest_matrices = []
+        self.densest_matrices = SubmatrixStack(r, d, b)
     
+    def clear(self) -> None:
+        """
+        Resets the counts to zeros and the dense submatrices to their initial seeds.
+        """
+        super().clear()
+        self.initialize_dense_submatrices()
+
     def decay(self, decay_factor: float) -> None:
         """
         Decays the count values and optionally decays the densest_matrices using NumPy operations.
@@ -24,34 +39,92 @@ class HcmsAnoedgeLocal(Hcms):
         Parameters:
         - decay_factor (float): Factor to decay the count values.
         """
-        self.count *= decay_factor
+        if self.lazy_decay:
+            # Submatrix sums are kept in the same scaled units as count.
+            super().decay(decay_factor)
+            return
+
+        with self._writing():
+            self.count *= decay_factor
+
+        self.densest_matrices.decay(decay_factor)
+
+    def renormalize(self) -> None:
+        """
+        Folds the lazy decay scale into the count tensor and the dense submatrices.
+        """
+        self.densest_matrices.decay(self.scale)
+        super().renormalize()
+
+    def _counts_merged(self) -> None:
+        if not self.densest_matrices.submatrix_sum.any():
+            # Nothing was learned yet: warm start from the merged counts.
+            self.initialize_dense_submatrices()
+            return
+        # The dense submatrices keep their rows and columns, their sums follow the merged counts.
+        self.densest_matrices.recompute_sums(self.count)
+
+    def save(self, directory: str) -> None:
+        """
+        Saves the sketch and the dense submatrices into a directory.
+
+        Parameters:
+        - directory (str): Destination directory, created if needed.
+        """
+        super().save(directory)
+        state = self.densest_matrices.to_list()
+        with open(os.path.join(directory, 'submatrices.json'), 'w') as file:
+            json.dump(state, file)
+
+    def restore(self, directory: str, mmap: bool = True) -> None:
+        """
+        Restores the sketch and the dense submatrices written by save. If the directory
+        has no submatrices, they are initialized from the restored counts.
 
-        for row in self.densest_matrices:
-            for submatrix in row:
-                submatrix.decay(decay_factor)
+        Parameters:
+        - directory (str): Directory written by save.
+        - mmap (bool): If True, the count tensor is memory-mapped copy-on-write.
+        """
+        super().restore(directory, mmap)
+        path = os.path.join(directory, 'submatrices.json')
+        if not os.path.exists(path):
+            # A sketch saved without submatrices, such as a plain Hcms: warm start from its counts.
+            self.initialize_dense_submatrices()
+            return
+        with open(path, 'r') as file:
+            state = json.load(file)
+        if state:
+            self.densest_matrices = SubmatrixStack.from_list(state, self.num_buckets)
+            self.num_dense_submatrices = self.densest_matrices.shape[1]
     
 
     def initialize_dense_submatrices(self) -> None:
         """
         Initializes dense submatrices based on count values.
+
+        Submatrix j of each row starts at the cell with the j-th largest count, found by
+        get_top_k_cells, so a detector built on an existing sketch starts from its
+        densest cells, the lowest flat index first among equal counts. Rows with fewer
+        than d non-zero cells seed the other submatrices on the diagonal, which is the
+        only seed of an empty sketch.
         """
+        d = self.num_dense_submatrices
+        row_idx = np.broadcast_to(np.arange(d), (self.num_rows, d)).copy()
+        col_idx = row_idx.copy()
 
         for i in range(self.num_rows):
-            cur_dense_submatrix = []
-            flat_counts = []
-
-            for j in range(self.num_buckets):
-                for k in range(self.num_buckets):
-                    flat_counts.append((self.count[i][j][k], (j, k)))
+            top = self.get_top_k_cells(self.count[i], d)
+            rows, cols = np.divmod(top, self.num_buckets)
+            values = np.array([self.count[i][row][col] for row, col in zip(rows.tolist(), cols.tolist())], dtype=float)
+            # The selection is deterministic, sorting it puts the largest counts first.
+            order = np.lexsort((top, -values))
+            order = order[values[order] > 0]
+            row_idx[i, :len(order)], col_idx[i, :len(order)] = rows[order], cols[order]
+
+        value = np.array([[self.count[i][row][col] for row, col in zip(rows, cols)]
+                          for i, (rows, cols) in enumerate(zip(row_idx.tolist(), col_idx.tolist()))], dtype=float)
+        self.densest_matrices.seed(row_idx, col_idx, value)
 
-            flat_counts.sort(key=lambda x: x[0], reverse=True)
-
-            for j in range(self.num_dense_submatrices):
-                initial_submatrix = Submatrix(j, j, 0.0)
-                cur_dense_submatrix.append(initial_submatrix)
-
-            self.densest_matrices.append(cur_dense_submatrix)
-        
     def get_anoedgelocal_score(self, src: int, dst: int) -> float:
         """
         Computes the minimum dsubgraph value for given source and destination nodes.
@@ -63,24 +136,19 @@ class HcmsAnoedgeLocal(Hcms):
         Returns:
         - float: Minimum dsubgraph value.
         """
-        min_dsubgraph = float('inf')
+        return self.get_anoedgelocal_bucket_score(self.hash_many(src)[:, 0].tolist(), self.hash_many(dst)[:, 0].tolist())
 
-        for i in range(self.num_rows):
-            src_bucket = self.hash(src, i)
-            dst_bucket = self.hash(dst, i)
-
-            for j in range(self.num_dense_submatrices):
-                if self.densest_matrices[i][j].checkAndAdd(src_bucket, dst_bucket, self.count[i]):
-                    flag = True
-                    del_cnt = -1
-                    while flag:
-                        flag = self.densest_matrices[i][j].checkAndDel(self.count[i])
-                        del_cnt += 1
-
-            cur_dsubgraph = 0.0
-            for j in range(self.num_dense_submatrices):
-                cur_likelihood = self.densest_matrices[i][j].getLikelihoodScore(src_bucket, dst_bucket, self.count[i])
-                cur_dsubgraph += cur_likelihood
-
-            min_dsubgraph = min(min_dsubgraph, cur_dsubgraph)
-        return min_dsubgraph
\ No newline at end of file
+    def get_anoedgelocal_bucket_score(self, src_buckets: list, dst_buckets: list) -> float:
+        """
+        Computes the minimum dsubgraph value of an edge already hashed with hash_many,
+        updating the dense submatrices.
+
+        Parameters:
+        - src_buckets (list): Bucket of the source node in each row.
+        - dst_buckets (list): Bucket of the destination node in each row.
+
+        Returns:
+        - float: Minimum dsubgraph value.
+        """
+        row_scores = self.densest_matrices.update(self.count, src_buckets, dst_buckets, 1.0 / self.scale)
+        return float(row_scores.min()) * self.scale
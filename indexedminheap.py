@@ -0,0 +1,109 @@
+import numpy as np
+
+class IndexedMinHeap:
+    def __init__(self, keys: np.ndarray, ties: np.ndarray):
+        """
+        Initializes a binary min-heap of integer items whose keys live in an external
+        array, with the position of every item so that any item can be updated or
+        removed in O(log n).
+
+        The heap reads keys[item] when comparing, so keys can be changed in place, and
+        then item has to be updated. Multiplying every key by the same positive factor
+        keeps the heap valid without any update. Items with equal keys are ordered by
+        ties[item].
+
+        Parameters:
+        - keys (np.ndarray): Key of every item.
+        - ties (np.ndarray): Tie-breaker of every item.
+
+        """
+        self.keys = keys
+        self.ties = ties
+        self.heap = []
+        self.pos = {}
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self.pos
+
+    def peek(self) -> int:
+        """Return the item with the smallest key, or -1 if the heap is empty."""
+        return self.heap[0] if self.heap else -1
+
+    def push(self, item: int) -> None:
+        """Add an item, with its current key."""
+        self.pos[item] = len(self.heap)
+        self.heap.append(item)
+        self._sift_up(len(self.heap) - 1)
+
+    def remove(self, item: int) -> None:
+        """Remove an item."""
+        idx = self.pos.pop(item)
+        last = self.heap.pop()
+        if idx < len(self.heap):
+            self.heap[idx] = last
+            self.pos[last] = idx
+            self._sift_up(idx)
+            self._sift_down(self.pos[last])
+
+    def update(self, item: int) -> None:
+        """Restore the heap order after the key of item changed."""
+        idx = self.pos[item]
+        self._sift_up(idx)
+        self._sift_down(self.pos[item])
+
+    def rebuild(self) -> None:
+        """Restore the heap order after any number of keys changed."""
+        # A sorted array is a valid heap, and sorting runs in NumPy.
+        items = np.array(self.heap, dtype=np.int64)
+        items = items[np.lexsort((self.ties[items], self.keys[items]))]
+        self.heap = items.tolist()
+        self.pos = {item: idx for idx, item in enumerate(self.heap)}
+
+    def add_to_keys(self, items: list, values: list) -> None:
+        """
+        Add values to the keys of several items. Each key is changed and its item
+        sifted before the next key changes, so every sift runs on a valid heap.
+
+        Parameters:
+        - items (list): Items whose keys change.
+        - values (list): Value added to the key of each item.
+
+        """
+        keys = self.keys
+        for item, value in zip(items, values):
+            keys[item] += value
+            self.update(item)
+
+    def _less(self, a: int, b: int) -> bool:
+        key_a = self.keys[a]
+        key_b = self.keys[b]
+        return key_a < key_b or (key_a == key_b and self.ties[a] < self.ties[b])
+
+    def _swap(self, i: int, j: int) -> None:
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.pos[heap[i]] = i
+        self.pos[heap[j]] = j
+
+    def _sift_up(self, idx: int) -> None:
+        while idx > 0:
+            parent = (idx - 1) // 2
+            if not self._less(self.heap[idx], self.heap[parent]):
+                break
+            self._swap(idx, parent)
+            idx = parent
+
+    def _sift_down(self, idx: int) -> None:
+        size = len(self.heap)
+        while True:
+            smallest = idx
+            for child in (2 * idx + 1, 2 * idx + 2):
+                if child < size and self._less(self.heap[child], self.heap[smallest]):
+                    smallest = child
+            if smallest == idx:
+                break
+            self._swap(idx, smallest)
+            idx = smallest
@@ -0,0 +1,145 @@
+import hashlib
+import numpy as np
+
+class NodeInterner:
+    def __init__(self, hcms, capacity: int = 65536):
+        """
+        Initializes a table mapping arbitrary hashable node keys (strings, IP addresses,
+        tuples...) to the bucket vectors of an Hcms, so that recurring nodes are hashed
+        once.
+
+        Every key gets a stable integer node id: integers are used as is, and other keys
+        are reduced to 32 bits with blake2b, so ids do not depend on arrival order and
+        sketches built with the same seed in different processes agree. The bucket
+        vectors of up to capacity keys are kept in a dense array, one slot per key, and
+        the clock algorithm evicts keys that were not used recently.
+
+        Parameters:
+        - hcms (Hcms): Sketch whose hash functions are cached.
+        - capacity (int): Number of cached keys.
+
+        """
+        if capacity < 1:
+            raise ValueError(f"Invalid value: {capacity}. capacity must be at least 1.")
+
+        self.hcms = hcms
+        self.capacity = capacity
+        self.slots = {}
+        self.slot_keys = [None] * capacity
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.table = np.empty((capacity, hcms.num_rows), dtype=np.int64)
+        self.referenced = bytearray(capacity)
+        self.size = 0
+        self.hand = 0
+        self.evictions = 0
+        self._hash_params = (hcms.hash_a, hcms.hash_b)
+
+    @staticmethod
+    def node_id(key) -> int:
+        """
+        Return the integer node id of a key.
+
+        Parameters:
+        - key (Hashable): Node key.
+
+        Returns:
+        - int: The node id.
+        """
+        if isinstance(key, (int, np.integer)):
+            return int(key)
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=4).digest()
+        return int.from_bytes(digest, 'little')
+
+    def ids_many(self, keys) -> np.ndarray:
+        """Return the node ids of a sequence of keys."""
+        return np.fromiter((self.node_id(key) for key in keys), dtype=np.int64)
+
+    def clear(self) -> None:
+        """Drops every cached bucket vector."""
+        self.slots.clear()
+        self.slot_keys = [None] * self.capacity
+        self.referenced = bytearray(self.capacity)
+        self.size = 0
+        self.hand = 0
+        self._hash_params = (self.hcms.hash_a, self.hcms.hash_b)
+
+    def _slot(self, key) -> int:
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.referenced[slot] = 1
+            return slot
+
+        if self.size < self.capacity:
+            slot = self.size
+            self.size += 1
+        else:
+            # Clock sweep: skip and unmark recently used slots.
+            while self.referenced[self.hand]:
+                self.referenced[self.hand] = 0
+                self.hand = (self.hand + 1) % self.capacity
+            slot = self.hand
+            self.hand = (self.hand + 1) % self.capacity
+            del self.slots[self.slot_keys[slot]]
+            self.evictions += 1
+
+        self.slots[key] = slot
+        self.slot_keys[slot] = key
+        self.referenced[slot] = 1
+        self.ids[slot] = self.node_id(key)
+        self.table[slot] = self.hcms.hash_many(self.ids[slot])[:, 0]
+        return slot
+
+    def _check_hash_params(self) -> None:
+        # Restoring or attaching the sketch replaces its hash functions.
+        if self._hash_params[0] is not self.hcms.hash_a or self._hash_params[1] is not self.hcms.hash_b:
+            self.clear()
+
+    def buckets(self, key) -> np.ndarray:
+        """
+        Return the bucket of a node in every row.
+
+        Parameters:
+        - key (Hashable): Node key.
+
+        Returns:
+        - np.ndarray: Array of shape (num_rows,).
+        """
+        self._check_hash_params()
+        return self.table[self._slot(key)].copy()
+
+    def intern_many(self, keys):
+        """
+        Return the node ids and buckets of a sequence of nodes.
+
+        Parameters:
+        - keys (Iterable[Hashable]): Node keys.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: Node ids, and buckets in the layout of
+          Hcms.hash_many, of shape (num_rows, len(keys)).
+        """
+        self._check_hash_params()
+        keys = list(keys)
+        evictions = self.evictions
+        slots = np.fromiter((self._slot(key) for key in keys), dtype=np.int64, count=len(keys))
+        ids = self.ids[slots]
+        buckets = self.table[slots].T
+        if self.evictions != evictions:
+            # Slots filled earlier in this batch may have been reused by later keys.
+            stale = [k for k, slot in enumerate(slots.tolist()) if self.slot_keys[slot] != keys[k]]
+            if stale:
+                ids[stale] = self.ids_many([keys[k] for k in stale])
+                buckets[:, stale] = self.hcms.hash_many(ids[stale])
+        return ids, buckets
+
+    def buckets_many(self, keys) -> np.ndarray:
+        """
+        Return the buckets of a sequence of nodes, in the layout of Hcms.hash_many.
+
+        Parameters:
+        - keys (Iterable[Hashable]): Node keys.
+
+        Returns:
+        - np.ndarray: Array of shape (num_rows, len(keys)).
+        """
+        return self.intern_many(keys)[1]
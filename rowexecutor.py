@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import weakref
+
+
+def _run_shared_kernel(task):
+    """
+    Runs a density kernel on one row of a count tensor held in shared memory.
+    Executed in the worker processes of a RowExecutor.
+    """
+    cls, method_name, shm_name, shape, dtype, row, args = task
+    shm = SharedMemory(name=shm_name)
+    try:
+        count = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        result = getattr(cls.__new__(cls), method_name)(count[row], *args)
+        del count
+        return result
+    finally:
+        shm.close()
+
+
+def _release_segment(shm: SharedMemory) -> None:
+    """
+    Frees a shared memory segment. The name is unlinked first, so the segment is
+    released even if arrays built on it are still alive.
+    """
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # Arrays still use the mapping; it goes away with them.
+        pass
+
+
+class RowExecutor:
+    def __init__(self, workers: int = 1, kind: str = 'thread'):
+        """
+        Initializes an executor scoring the independent rows of a sketch concurrently.
+
+        Parameters:
+        - workers (int): Number of workers. 1 scores the rows serially.
+        - kind (str): thread, for kernels dominated by NumPy calls that release the GIL,
+          or process, for Python-heavy kernels. In process mode the count tensor lives
+          in shared memory so workers read it without copying.
+
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Invalid value: {kind}. Value must be either thread or process.")
+        if workers < 1:
+            raise ValueError(f"Invalid value: {workers}. workers must be at least 1.")
+
+        self.workers = workers
+        self.kind = kind
+        self._pool = None
+        self._thread_pool = None
+        self._shm = None
+        self._finalizer = None
+
+    def allocate(self, shape: tuple, dtype=float) -> np.ndarray:
+        """
+        Allocates a zero-filled count tensor, in shared memory when using processes.
+
+        Parameters:
+        - shape (tuple): Shape of the tensor.
+        - dtype: Data type of the tensor.
+
+        Returns:
+        - np.ndarray: The allocated tensor.
+        """
+        if self.kind != 'process' or self.workers == 1:
+            return np.zeros(shape, dtype=dtype)
+
+        if self._shm is not None:
+            raise RuntimeError("This executor already holds a shared count tensor.")
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        self._shm = SharedMemory(create=True, size=nbytes)
+        # Unlinks the segment when the executor is collected or at exit, if release_memory was not called.
+        self._finalizer = weakref.finalize(self, _release_segment, self._shm)
+        count = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+        count.fill(0)
+        return count
+
+    def uses_shared_memory(self) -> bool:
+        """Return True if the count tensor was allocated in shared memory."""
+        return self._shm is not None
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self._thread_pool
+
+    def map(self, fn, num_rows: int) -> list:
+        """
+        Calls fn on every row index, with threads when workers > 1. Suitable for
+        functions that update per-row state.
+
+        Parameters:
+        - fn (Callable[[int], Any]): Function of the row index.
+        - num_rows (int): Number of rows.
+
+        Returns:
+        - list: Results, in row order.
+        """
+        if self.workers == 1 or num_rows == 1:
+            return [fn(i) for i in range(num_rows)]
+        return list(self._get_thread_pool().map(fn, range(num_rows)))
+
+    def map_kernel(self, owner, method_name: str, count: np.ndarray, row_args: list) -> list:
+        """
+        Calls the density kernel owner.method_name(count[i], *row_args[i]) on every row.
+        The kernel must not depend on the state of owner in process mode.
+
+        Parameters:
+        - owner (Hcms): Sketch defining the kernel.
+        - method_name (str): Name of the kernel.
+        - count (np.ndarray): Count tensor.
+        - row_args (list): Extra arguments for each row.
+
+        Returns:
+        - list: Results, in row order.
+        """
+        if self.kind == 'process' and self.workers > 1 and self._shm is not None:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            tasks = [(type(owner), method_name, self._shm.name, count.shape, count.dtype, i, tuple(args))
+                     for i, args in enumerate(row_args)]
+            return list(self._pool.map(_run_shared_kernel, tasks))
+
+        kernel = getattr(owner, method_name)
+        return self.map(lambda i: kernel(count[i], *row_args[i]), len(row_args))
+
+    def release_memory(self) -> None:
+        """Frees the shared memory segment, if any. Arrays built on it must be dropped first."""
+        if self._shm is not None:
+            self._finalizer()
+            self._finalizer = None
+            self._shm = None
+
+    def close(self) -> None:
+        """Shuts down the worker pools. Shared memory stays valid until release_memory."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
@@ -0,0 +1,213 @@
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import time
+
+class SharedSketch:
+    # Layout of the segment: this header, hash_a, hash_b, then the count tensor.
+    HEADER = np.dtype([('seq', '<u8'), ('num_rows', '<i8'), ('num_buckets', '<i8'),
+                       ('scale', '<f8'), ('dtype', 'S16')])
+    ALIGNMENT = 64
+    # begin_read spins this many times, then sleeps with a doubling delay capped at
+    # MAX_BACKOFF seconds, and gives up after READ_TIMEOUT seconds.
+    SPINS = 100
+    MAX_BACKOFF = 1e-3
+    READ_TIMEOUT = 10.0
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        """
+        Wraps a named shared memory segment holding an Hcms count tensor and its hash
+        parameters. Use create or attach rather than this constructor.
+
+        A sequence counter guards the data: the writer makes it odd while updating and
+        even when done, so a reader can detect that the sketch changed under it.
+
+        Parameters:
+        - shm (SharedMemory): The segment.
+        - owner (bool): True for the writer that created the segment.
+
+        """
+        self.shm = shm
+        self.owner = owner
+        self.depth = 0
+        self.header = np.ndarray((), dtype=self.HEADER, buffer=shm.buf)
+
+        num_rows = int(self.header['num_rows'])
+        num_buckets = int(self.header['num_buckets'])
+        dtype = np.dtype(self.header['dtype'].item().decode())
+
+        offset = self.HEADER.itemsize
+        self.hash_a = np.ndarray((num_rows,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += num_rows * 8
+        self.hash_b = np.ndarray((num_rows,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset = self._count_offset(num_rows)
+        self.count = np.ndarray((num_rows, num_buckets, num_buckets), dtype=dtype, buffer=shm.buf, offset=offset)
+
+        if not owner:
+            self.hash_a.setflags(write=False)
+            self.hash_b.setflags(write=False)
+            self.count.setflags(write=False)
+
+    @classmethod
+    def _count_offset(cls, num_rows: int) -> int:
+        offset = cls.HEADER.itemsize + 2 * num_rows * 8
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
+
+    @classmethod
+    def create(cls, name: str, num_rows: int, num_buckets: int, dtype=np.float64) -> 'SharedSketch':
+        """
+        Creates a named segment for a sketch. The caller becomes its single writer.
+
+        Parameters:
+        - name (str): Name of the segment.
+        - num_rows (int): Number of rows of the sketch.
+        - num_buckets (int): Number of buckets of the sketch.
+        - dtype: Data type of the count tensor.
+
+        Returns:
+        - SharedSketch: The writer side of the segment.
+        """
+        dtype = np.dtype(dtype)
+        size = cls._count_offset(num_rows) + num_rows * num_buckets * num_buckets * dtype.itemsize
+        shm = SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((), dtype=cls.HEADER, buffer=shm.buf)
+        header['seq'] = 0
+        header['num_rows'] = num_rows
+        header['num_buckets'] = num_buckets
+        header['scale'] = 1.0
+        header['dtype'] = dtype.str.encode()
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedSketch':
+        """
+        Attaches to an existing segment as a read-only reader.
+
+        Parameters:
+        - name (str): Name of the segment.
+
+        Returns:
+        - SharedSketch: The reader side of the segment.
+        """
+        try:
+            shm = SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 every attach is tracked, and the tracker of this
+            # process would remove the segment when the reader exits.
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                shm = SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        return cls(shm, owner=False)
+
+    def num_rows(self) -> int:
+        return int(self.header['num_rows'])
+
+    def num_buckets(self) -> int:
+        return int(self.header['num_buckets'])
+
+    def dtype(self) -> np.dtype:
+        return self.count.dtype
+
+    def scale(self) -> float:
+        return float(self.header['scale'])
+
+    @contextmanager
+    def writing(self, hcms):
+        """
+        Context manager wrapping every update of the writer. The decay scale of hcms
+        is published when the update ends.
+        """
+        # Nested updates (e.g. decay triggering renormalize) count as one.
+        self.depth += 1
+        if self.depth == 1:
+            self.header['seq'] += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.header['scale'] = hcms.scale
+                self.header['seq'] += 1
+
+    def begin_read(self, timeout: float = None) -> int:
+        """
+        Waits until no update is in progress and returns the sequence number. Short
+        updates are waited for by spinning, longer ones (e.g. a decay of a large
+        sketch) by sleeping.
+
+        Parameters:
+        - timeout (float): Seconds to wait, READ_TIMEOUT if None.
+
+        Returns:
+        - int: The sequence number to pass to validate_read.
+
+        Raises:
+        - TimeoutError: If an update is still in progress after timeout seconds, e.g.
+          because the writer died in the middle of an update.
+        """
+        timeout = self.READ_TIMEOUT if timeout is None else timeout
+        deadline = None
+        delay = 1e-6
+        spins = 0
+        while True:
+            seq = int(self.header['seq'])
+            if seq % 2 == 0:
+                return seq
+            if spins < self.SPINS:
+                spins += 1
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"An update of the shared sketch has been in progress for more than {timeout} seconds.")
+            time.sleep(delay)
+            delay = min(2 * delay, self.MAX_BACKOFF)
+
+    def validate_read(self, seq: int) -> bool:
+        """Return True if no update happened since begin_read returned seq."""
+        return int(self.header['seq']) == seq
+
+    def snapshot(self, retries: int):
+        """
+        Copies the count tensor row by row. Each row is copied inside its own read
+        section, retried up to retries times if an update overlaps it, and rescaled to
+        the lazy decay scale of the last row, so rows may be a few updates apart. A
+        row copied without overlapping an update is consistent. If every attempt on a
+        row overlaps an update, the last copy is kept, and only each cell is read
+        whole: the row may hold half of an edge update, and with eager decay (which
+        multiplies the counts inside one update) part of it may already be decayed.
+
+        Parameters:
+        - retries (int): Number of attempts per row.
+
+        Returns:
+        - Tuple[np.ndarray, float]: The copy and its scale.
+        """
+        count = np.empty_like(self.count)
+        scales = []
+        for i in range(self.num_rows()):
+            for _ in range(retries):
+                seq = self.begin_read()
+                count[i] = self.count[i]
+                scale = self.scale()
+                if self.validate_read(seq):
+                    break
+            scales.append(scale)
+
+        for i, scale in enumerate(scales):
+            if scale != scales[-1]:
+                count[i] *= scale / scales[-1]
+        return count, scales[-1]
+
+    def close(self) -> None:
+        """Detaches from the segment, and removes it when called by the writer."""
+        self.header = self.hash_a = self.hash_b = self.count = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,234 @@
+import numpy as np
+
+class SparseMatrix:
+    def __init__(self, num_rows: int, num_cols: int, dtype=np.float64):
+        """
+        Initializes a matrix that only stores its non-zero cells, with row and column
+        adjacency so the non-zero cells of a row or column can be listed directly.
+        Cells whose value becomes exactly zero are dropped.
+
+        Parameters:
+        - num_rows (int): Number of rows.
+        - num_cols (int): Number of columns.
+        - dtype: Data type of the values.
+
+        """
+        self.shape = (num_rows, num_cols)
+        self.dtype = np.dtype(dtype)
+        self.cells = {}
+        self.row_cols = {}
+        self.col_rows = {}
+        # Python floats already are float64, other dtypes are rounded on every update.
+        self._cast = None if self.dtype == np.float64 else self.dtype.type
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def nnz(self) -> int:
+        """Return the number of stored cells."""
+        return len(self.cells)
+
+    def add(self, row: int, col: int, value: float) -> None:
+        """
+        Add a value to a cell.
+
+        Parameters:
+        - row (int): Row of the cell.
+        - col (int): Column of the cell.
+        - value (float): Value to add.
+
+        """
+        key = (row, col)
+        new_value = self.cells.get(key, 0) + value
+        if self._cast is not None:
+            new_value = self._cast(new_value).item()
+
+        if new_value == 0:
+            if key in self.cells:
+                del self.cells[key]
+                self.row_cols[row].discard(col)
+                self.col_rows[col].discard(row)
+            return
+
+        if key not in self.cells:
+            self.row_cols.setdefault(row, set()).add(col)
+            self.col_rows.setdefault(col, set()).add(row)
+        self.cells[key] = new_value
+
+    def get(self, row: int, col: int) -> float:
+        """Return the value of a cell."""
+        return self.cells.get((row, col), 0.0)
+
+    def nonzero_in_row(self, row: int):
+        """
+        Return the non-zero cells of a row, by increasing column.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: Columns and values of the cells.
+        """
+        cols = sorted(self.row_cols.get(row, ()))
+        values = [self.cells[(row, col)] for col in cols]
+        return np.array(cols, dtype=np.int64), np.array(values, dtype=float)
+
+    def nonzero_in_col(self, col: int):
+        """
+        Return the non-zero cells of a column, by increasing row.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: Rows and values of the cells.
+        """
+        rows = sorted(self.col_rows.get(col, ()))
+        values = [self.cells[(row, col)] for row in rows]
+        return np.array(rows, dtype=np.int64), np.array(values, dtype=float)
+
+    def _cell_arrays(self):
+        rows = np.fromiter((key[0] for key in self.cells), dtype=np.int64, count=len(self.cells))
+        cols = np.fromiter((key[1] for key in self.cells), dtype=np.int64, count=len(self.cells))
+        values = np.fromiter(self.cells.values(), dtype=float, count=len(self.cells))
+        return rows, cols, values
+
+    def row_sums(self) -> np.ndarray:
+        """Return the sum of every row."""
+        rows, _, values = self._cell_arrays()
+        return np.bincount(rows, weights=values, minlength=self.shape[0]).astype(float)
+
+    def col_sums(self) -> np.ndarray:
+        """Return the sum of every column."""
+        _, cols, values = self._cell_arrays()
+        return np.bincount(cols, weights=values, minlength=self.shape[1]).astype(float)
+
+    def flat_cells(self):
+        """
+        Return the flat indices and values of the stored cells, by increasing flat index.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: Flat indices and values.
+        """
+        rows, cols, values = self._cell_arrays()
+        flat_idx = rows * self.shape[1] + cols
+        order = np.argsort(flat_idx)
+        return flat_idx[order], values[order]
+
+    def scale(self, factor: float) -> None:
+        """Multiply every stored cell by factor."""
+        for key, value in self.cells.items():
+            new_value = value * factor
+            self.cells[key] = new_value if self._cast is None else self._cast(new_value).item()
+
+    def clear(self) -> None:
+        """Remove every stored cell."""
+        self.cells.clear()
+        self.row_cols.clear()
+        self.col_rows.clear()
+
+    def toarray(self) -> np.ndarray:
+        """Return the matrix as a dense array."""
+        mat = np.zeros(self.shape, dtype=self.dtype)
+        for (row, col), value in self.cells.items():
+            mat[row, col] = value
+        return mat
+
+    def __getitem__(self, key):
+        # Supports the dense array access patterns of the detectors: mat[i][j], mat[i, j],
+        # mat[i, list_of_cols] and mat[list_of_rows, j].
+        if not isinstance(key, tuple):
+            return _SparseRow(self, key)
+
+        row, col = key
+        if np.ndim(row) == 0 and np.ndim(col) == 0:
+            return self.get(row, col)
+        if np.ndim(row) == 0:
+            return np.array([self.cells.get((row, c), 0.0) for c in col], dtype=float)
+        if np.ndim(col) == 0:
+            return np.array([self.cells.get((r, col), 0.0) for r in row], dtype=float)
+        raise IndexError("SparseMatrix only supports indexing a cell, a row slice or a column slice.")
+
+
+class _SparseRow:
+    def __init__(self, mat: SparseMatrix, row: int):
+        self.mat = mat
+        self.row = row
+
+    def __getitem__(self, col):
+        return self.mat[self.row, col]
+
+
+class SparseCount:
+    def __init__(self, r: int, b: int, dtype=np.float64):
+        """
+        Initializes a sparse replacement for the r x b x b count tensor of Hcms.
+
+        Parameters:
+        - r (int): Number of rows.
+        - b (int): Number of buckets.
+        - dtype: Data type of the counts.
+
+        """
+        self.shape = (r, b, b)
+        self.dtype = np.dtype(dtype)
+        self.rows = [SparseMatrix(b, b, dtype) for _ in range(r)]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i: int) -> SparseMatrix:
+        return self.rows[i]
+
+    def nnz(self) -> int:
+        """Return the number of stored cells over all rows."""
+        return sum(mat.nnz() for mat in self.rows)
+
+    def fill(self, value: float) -> None:
+        """Reset every count. Only zero is supported."""
+        if value != 0:
+            raise ValueError("A SparseCount can only be filled with zeros.")
+        for mat in self.rows:
+            mat.clear()
+
+    def __imul__(self, factor: float):
+        for mat in self.rows:
+            mat.scale(factor)
+        return self
+
+    def add_at(self, source_buckets: np.ndarray, destination_buckets: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Add weights to cells, one column of buckets per edge.
+
+        Parameters:
+        - source_buckets (np.ndarray): Array of shape (r,) or (r, n) holding source buckets.
+        - destination_buckets (np.ndarray): Array of the same shape holding destination buckets.
+        - weights (np.ndarray): Weight of each edge, broadcastable to (n,).
+
+        """
+        source_buckets = np.asarray(source_buckets).reshape(len(self.rows), -1)
+        destination_buckets = np.asarray(destination_buckets).reshape(len(self.rows), -1)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), source_buckets.shape[1:]).tolist()
+
+        for mat, srcs, dsts in zip(self.rows, source_buckets.tolist(), destination_buckets.tolist()):
+            for src, dst, weight in zip(srcs, dsts, weights):
+                mat.add(src, dst, weight)
+
+    def get_at(self, source_buckets: np.ndarray, destination_buckets: np.ndarray) -> np.ndarray:
+        """Return the value of cell (source_buckets[i], destination_buckets[i]) of every row i."""
+        return np.array([mat.get(src, dst) for mat, src, dst in
+                         zip(self.rows, np.asarray(source_buckets).tolist(), np.asarray(destination_buckets).tolist())])
+
+    def row_slices(self, rows: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+        """Return row buckets[k] of matrix rows[k] for every k, as a dense array of shape (len(rows), b)."""
+        out = np.zeros((len(rows), self.shape[2]))
+        for k, (i, bucket) in enumerate(zip(np.asarray(rows).tolist(), np.asarray(buckets).tolist())):
+            cols, values = self.rows[i].nonzero_in_row(bucket)
+            out[k, cols] = values
+        return out
+
+    def col_slices(self, rows: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+        """Return column buckets[k] of matrix rows[k] for every k, as a dense array of shape (len(rows), b)."""
+        out = np.zeros((len(rows), self.shape[1]))
+        for k, (i, bucket) in enumerate(zip(np.asarray(rows).tolist(), np.asarray(buckets).tolist())):
+            row_idx, values = self.rows[i].nonzero_in_col(bucket)
+            out[k, row_idx] = values
+        return out
+
+    def toarray(self) -> np.ndarray:
+        """Return the counts as a dense r x b x b array."""
+        return np.stack([mat.toarray() for mat in self.rows])
@@ -0,0 +1,491 @@
+from indexedminheap import IndexedMinHeap
+from sparsecount import SparseCount
+import numpy as np
+
+class SubmatrixStack:
+    # Stacks of at most this many submatrices are updated one submatrix at a time, which
+    # takes fewer NumPy calls per edge than updating all of them together.
+    LOOP_SIZE = 4
+
+    def __init__(self, r: int, d: int, b: int):
+        """
+        Initializes the d dense submatrices of each of the r rows of a sketch as stacked
+        arrays, so that an edge updates and scores all r x d submatrices with a few NumPy
+        operations. Up to LOOP_SIZE submatrices, as with the default single submatrix per
+        row, an edge rather updates them one at a time and only reads the cells of their
+        members, which is cheaper than the fixed cost of the stacked operations.
+
+        Submatrix (i, j) is a dense submatrix of matrix i of the count tensor. Its rows
+        and columns are boolean masks of length b, with their sums in float vectors, and
+        members keep the order in which they were added, which breaks ties between equal
+        sums. The members of each submatrix are also kept in two indexed min-heaps (rows
+        and columns) over slices of these vectors, so a delete step finds the smallest
+        sum in O(1) and updates the heaps in O(log n) per changed sum. Every submatrix
+        starts empty, see seed.
+
+        Parameters:
+        - r (int): Number of rows of the sketch.
+        - d (int): Number of dense submatrices per row.
+        - b (int): Number of buckets.
+
+        """
+        self.shape = (r, d, b)
+        # Index (i, j) of every submatrix, to address one bucket per submatrix.
+        self.index = np.indices((r, d))
+        self.rows = np.arange(r)
+        self.clear()
+
+    def clear(self) -> None:
+        """Empties every submatrix."""
+        r, d, b = self.shape
+        self.row_mask = np.zeros((r, d, b), dtype=bool)
+        self.col_mask = np.zeros((r, d, b), dtype=bool)
+        self.row_sums = np.zeros((r, d, b))
+        self.col_sums = np.zeros((r, d, b))
+        self.row_order = np.zeros((r, d, b), dtype=np.int64)
+        self.col_order = np.zeros((r, d, b), dtype=np.int64)
+        self.next_order = np.zeros((r, d), dtype=np.int64)
+        self.submatrix_sum = np.zeros((r, d))
+        self.submatrix_rows_count = np.zeros((r, d), dtype=np.int64)
+        self.submatrix_cols_count = np.zeros((r, d), dtype=np.int64)
+        # The heaps read their keys from views of row_sums and col_sums, which therefore
+        # must only be updated in place.
+        self.row_heaps = [[IndexedMinHeap(self.row_sums[i, j], self.row_order[i, j]) for j in range(d)] for i in range(r)]
+        self.col_heaps = [[IndexedMinHeap(self.col_sums[i, j], self.col_order[i, j]) for j in range(d)] for i in range(r)]
+
+    def _rebuild_heaps(self) -> None:
+        # Refills every heap from the masks, after the members or sums changed in bulk.
+        r, d, _ = self.shape
+        for i in range(r):
+            for j in range(d):
+                for heap, mask in ((self.row_heaps[i][j], self.row_mask[i, j]), (self.col_heaps[i][j], self.col_mask[i, j])):
+                    heap.heap = np.flatnonzero(mask).tolist()
+                    heap.rebuild()
+
+    @staticmethod
+    def _add_to_sums(heaps, mask: np.ndarray, i: np.ndarray, j: np.ndarray, lines: np.ndarray) -> None:
+        # Adds lines[k] to the sums of the members of submatrix (i[k], j[k]). Each sum changes
+        # and is sifted before the next one, so every sift runs on a valid heap.
+        k, idx = np.nonzero(mask[i, j] & (lines != 0))
+        for row, sub, item, value in zip(i[k].tolist(), j[k].tolist(), idx.tolist(), lines[k, idx].tolist()):
+            heaps[row][sub].add_to_keys((item,), (value,))
+
+    def seed(self, row_idx: np.ndarray, col_idx: np.ndarray, value: np.ndarray) -> None:
+        """
+        Resets every submatrix to a single cell.
+
+        Parameters:
+        - row_idx (np.ndarray): Row of the cell of each submatrix, of shape (r, d).
+        - col_idx (np.ndarray): Column of the cell of each submatrix, of shape (r, d).
+        - value (np.ndarray): Value of the cell of each submatrix, broadcastable to (r, d).
+
+        """
+        r, d, _ = self.shape
+        self.clear()
+        i, j = self.index
+        value = np.broadcast_to(np.asarray(value, dtype=float), (r, d))
+        self.row_mask[i, j, row_idx] = True
+        self.col_mask[i, j, col_idx] = True
+        self.row_sums[i, j, row_idx] = value
+        self.col_sums[i, j, col_idx] = value
+        self.col_order[i, j, col_idx] = 1
+        self.next_order[...] = 2
+        self.submatrix_sum[...] = value
+        self.submatrix_rows_count[...] = 1
+        self.submatrix_cols_count[...] = 1
+        self._rebuild_heaps()
+
+    @staticmethod
+    def _row_slices(count, rows: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+        # Row buckets[k] of the matrix rows[k] of the count tensor, for every k.
+        if isinstance(count, SparseCount):
+            return count.row_slices(rows, buckets)
+        return np.asarray(count[rows, buckets, :], dtype=float)
+
+    @staticmethod
+    def _col_slices(count, rows: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+        # Column buckets[k] of the matrix rows[k] of the count tensor, for every k.
+        if isinstance(count, SparseCount):
+            return count.col_slices(rows, buckets)
+        return np.asarray(count[rows, :, buckets], dtype=float)
+
+    def update(self, count, src_buckets: np.ndarray, dst_buckets: np.ndarray, value: float) -> np.ndarray:
+        """
+        Updates every submatrix with an edge and returns the likelihood score of each row.
+        A submatrix first adds the row and column of the edge if that increases its
+        density, and then, if it grew, deletes its row or column with the smallest sum
+        while that increases its density.
+
+        Parameters:
+        - count: Count tensor of shape (r, b, b), dense or SparseCount.
+        - src_buckets (np.ndarray): Bucket of the source node in each row.
+        - dst_buckets (np.ndarray): Bucket of the destination node in each row.
+        - value (float): Weight of the edge, in the units of count.
+
+        Returns:
+        - np.ndarray: Sum of the likelihood scores over the submatrices of each row.
+        """
+        r, d, _ = self.shape
+        if r * d <= self.LOOP_SIZE:
+            edges = enumerate(zip(np.asarray(src_buckets).tolist(), np.asarray(dst_buckets).tolist()))
+            return np.array([sum(self._update_one(count[i], i, j, src, dst, value) for j in range(d)) for i, (src, dst) in edges])
+
+        rows = self.rows
+        src_buckets = np.asarray(src_buckets, dtype=np.int64)
+        dst_buckets = np.asarray(dst_buckets, dtype=np.int64)
+        src_row = self._row_slices(count, rows, src_buckets)
+        dst_col = self._col_slices(count, rows, dst_buckets)
+        cell = src_row[rows, dst_buckets][:, None]
+
+        i, j = self.index
+        src_idx = (i, j, src_buckets[:, None])
+        dst_idx = (i, j, dst_buckets[:, None])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            added, both, src_in, dst_in = self._check_and_add(src_row, dst_col, cell, src_idx, dst_idx, value)
+            if added.any():
+                # Only the submatrices that grew can shrink.
+                i, j = np.nonzero(added)
+                while len(i):
+                    i, j = self._check_and_del(count, i, j)
+                both = self.row_mask[src_idx] & self.col_mask[dst_idx]
+                src_in, dst_in = self._masked_sums(src_row, dst_col)
+
+        score = dst_in + src_in - both * cell
+        # An empty submatrix scores 0.
+        ctr = self.submatrix_rows_count + self.submatrix_cols_count - both
+        return (score / np.maximum(ctr, 1)).sum(axis=1)
+
+    def _update_one(self, mat, i: int, j: int, src: int, dst: int, value: float) -> float:
+        # update for submatrix (i, j) alone, with the same steps on Python floats. Its sums
+        # are taken over its members only, so the cost follows the size of the submatrix
+        # rather than the number of buckets. Returns the likelihood score of the submatrix.
+        row_mask = self.row_mask[i, j]
+        col_mask = self.col_mask[i, j]
+        row_flag = bool(row_mask[src])
+        col_flag = bool(col_mask[dst])
+        src_in, dst_in = self._member_sums(mat, i, j, src, dst)
+        cell = float(mat[src, dst])
+
+        if row_flag and col_flag:
+            self.submatrix_sum[i, j] += value
+            self.row_sums[i, j, src] += value
+            self.col_sums[i, j, dst] += value
+            self.row_heaps[i][j].update(src)
+            self.col_heaps[i][j].update(dst)
+        else:
+            new_cell = cell if not row_flag and not col_flag else 0.0
+            row_sum = src_in if not row_flag else 0.0
+            col_sum = dst_in if not col_flag else 0.0
+            total = float(self.submatrix_sum[i, j])
+            new_sum = total + row_sum + col_sum + new_cell
+            rows_count = int(self.submatrix_rows_count[i, j])
+            cols_count = int(self.submatrix_cols_count[i, j])
+            # An empty submatrix never grows, as in the vectorized update where its density is nan.
+            if rows_count * cols_count and (total / np.sqrt(rows_count * cols_count) <
+                                            new_sum / np.sqrt((rows_count + (not row_flag)) * (cols_count + (not col_flag)))):
+                # Rows first, then columns, as in _check_and_add.
+                if not row_flag:
+                    self._add_one(mat, i, j, 0, src, row_sum + new_cell)
+                if not col_flag:
+                    self._add_one(mat, i, j, 1, dst, col_sum + new_cell)
+                self.submatrix_sum[i, j] = new_sum
+                while self._del_one(mat, i, j):
+                    pass
+                row_flag = bool(row_mask[src])
+                col_flag = bool(col_mask[dst])
+                src_in, dst_in = self._member_sums(mat, i, j, src, dst)
+
+        both = row_flag and col_flag
+        score = dst_in + src_in - (cell if both else 0.0)
+        ctr = int(self.submatrix_rows_count[i, j]) + int(self.submatrix_cols_count[i, j]) - both
+        return score / max(ctr, 1)
+
+    def _member_sums(self, mat, i: int, j: int, src: int, dst: int):
+        # Sum of row src over the columns of submatrix (i, j), and of column dst over its rows.
+        cols = self.col_mask[i, j].nonzero()[0]
+        rows = self.row_mask[i, j].nonzero()[0]
+        return float(mat[src, cols].sum(dtype=float)), float(mat[rows, dst].sum(dtype=float))
+
+    def _axis(self, axis: int):
+        # Mask, order, sums, counts and heaps of the rows (axis 0) or columns (axis 1), then
+        # the heaps and mask of the other axis.
+        if axis == 0:
+            return (self.row_mask, self.row_order, self.row_sums, self.submatrix_rows_count, self.row_heaps,
+                    self.col_heaps, self.col_mask)
+        return (self.col_mask, self.col_order, self.col_sums, self.submatrix_cols_count, self.col_heaps,
+                self.row_heaps, self.row_mask)
+
+    @staticmethod
+    def _line(mat, axis: int, idx: int, members: np.ndarray) -> np.ndarray:
+        # Cells of row (axis 0) or column (axis 1) idx of mat at the given members.
+        return np.asarray(mat[idx, members] if axis == 0 else mat[members, idx], dtype=float)
+
+    def _add_one(self, mat, i: int, j: int, axis: int, idx: int, line_sum: float) -> None:
+        # Adds row or column idx to submatrix (i, j), and its cells to the sums of the other axis.
+        mask, order, sums, counts, heaps, other_heaps, other_mask = self._axis(axis)
+        counts[i, j] += 1
+        mask[i, j, idx] = True
+        order[i, j, idx] = self.next_order[i, j]
+        self.next_order[i, j] += 1
+        sums[i, j, idx] = line_sum
+        heaps[i][j].push(idx)
+        members = np.flatnonzero(other_mask[i, j])
+        other_heaps[i][j].add_to_keys(members.tolist(), self._line(mat, axis, idx, members).tolist())
+
+    def _del_one(self, mat, i: int, j: int) -> bool:
+        # _check_and_del for submatrix (i, j) alone. Returns True if a row or column was deleted.
+        rows_count = int(self.submatrix_rows_count[i, j])
+        cols_count = int(self.submatrix_cols_count[i, j])
+        total = float(self.submatrix_sum[i, j])
+        min_row = self.row_heaps[i][j].peek()
+        min_col = self.col_heaps[i][j].peek()
+        min_row_sum = float(self.row_sums[i, j, min_row]) if min_row >= 0 else np.inf
+        min_col_sum = float(self.col_sums[i, j, min_col]) if min_col >= 0 else np.inf
+
+        row_del_density = np.inf
+        if rows_count > 1 and min_row_sum < np.inf:
+            row_del_density = (total - min_row_sum) / np.sqrt((rows_count - 1) * cols_count)
+        col_del_density = np.inf
+        if cols_count > 1 and min_col_sum < np.inf:
+            col_del_density = (total - min_col_sum) / np.sqrt(rows_count * (cols_count - 1))
+        cur_density = total / np.sqrt(rows_count * cols_count)
+
+        if cur_density > row_del_density and col_del_density < row_del_density:
+            self._remove_one(mat, i, j, 0, min_row, min_row_sum)
+            return True
+        if cur_density > col_del_density and row_del_density < col_del_density:
+            self._remove_one(mat, i, j, 1, min_col, min_col_sum)
+            return True
+        return False
+
+    def _remove_one(self, mat, i: int, j: int, axis: int, idx: int, line_sum: float) -> None:
+        # Removes row or column idx from submatrix (i, j), and its cells from the sums of the other axis.
+        mask, _, _, counts, heaps, other_heaps, other_mask = self._axis(axis)
+        counts[i, j] -= 1
+        mask[i, j, idx] = False
+        heaps[i][j].remove(idx)
+        members = np.flatnonzero(other_mask[i, j])
+        other_heaps[i][j].add_to_keys(members.tolist(), (-self._line(mat, axis, idx, members)).tolist())
+        self.submatrix_sum[i, j] -= line_sum
+
+    def _masked_sums(self, src_row: np.ndarray, dst_col: np.ndarray):
+        # Sum of the cells of src_row in the columns of every submatrix, and of dst_col in its rows.
+        return (np.einsum('idb,ib->id', self.col_mask, src_row),
+                np.einsum('idb,ib->id', self.row_mask, dst_col))
+
+    @staticmethod
+    def _density(rows_count: np.ndarray, cols_count: np.ndarray, total: np.ndarray) -> np.ndarray:
+        return total / np.sqrt(rows_count * cols_count)
+
+    def _check_and_add(self, src_row, dst_col, cell, src_idx, dst_idx, value: float):
+        # Adds the row and column of the edge to the submatrices whose density increases.
+        # Returns where a row or column was added, where the edge was already inside, and the
+        # sums of _masked_sums before the update.
+        row_flag = self.row_mask[src_idx]
+        col_flag = self.col_mask[dst_idx]
+        both = row_flag & col_flag
+
+        # The edge falls inside the submatrix: only the sums change.
+        if both.any():
+            inc = both * value
+            self.submatrix_sum += inc
+            self.row_sums[src_idx] += inc
+            self.col_sums[dst_idx] += inc
+            # A single sum changed in each heap.
+            for i, j in zip(*np.nonzero(both)):
+                self.row_heaps[i][j].update(int(src_idx[2][i, 0]))
+                self.col_heaps[i][j].update(int(dst_idx[2][i, 0]))
+
+        src_in, dst_in = self._masked_sums(src_row, dst_col)
+        new_row = ~row_flag
+        new_col = ~col_flag
+        new_cell = (new_row & new_col) * cell
+        row_sum = new_row * src_in
+        col_sum = new_col * dst_in
+        new_sum = self.submatrix_sum + row_sum + col_sum + new_cell
+
+        rows_count = self.submatrix_rows_count
+        cols_count = self.submatrix_cols_count
+        added = ~both & (self._density(rows_count, cols_count, self.submatrix_sum) <
+                         self._density(rows_count + new_row, cols_count + new_col, new_sum))
+        if not added.any():
+            return added, both, src_in, dst_in
+        add_row = added & new_row
+        add_col = added & new_col
+
+        # Rows first, then columns, so a new column also adds its cell to the new row.
+        self.submatrix_rows_count += add_row
+        self.row_mask[src_idx] |= add_row
+        self.row_order[src_idx] = np.where(add_row, self.next_order, self.row_order[src_idx])
+        self.next_order += add_row
+        self.row_sums[src_idx] = np.where(add_row, row_sum + new_cell, self.row_sums[src_idx])
+        row_i, row_j = np.nonzero(add_row)
+        for i, j in zip(row_i.tolist(), row_j.tolist()):
+            self.row_heaps[i][j].push(int(src_idx[2][i, 0]))
+        self._add_to_sums(self.col_heaps, self.col_mask, row_i, row_j, src_row[row_i])
+
+        self.submatrix_cols_count += add_col
+        self.col_mask[dst_idx] |= add_col
+        self.col_order[dst_idx] = np.where(add_col, self.next_order, self.col_order[dst_idx])
+        self.next_order += add_col
+        self.col_sums[dst_idx] = np.where(add_col, col_sum + new_cell, self.col_sums[dst_idx])
+        col_i, col_j = np.nonzero(add_col)
+        for i, j in zip(col_i.tolist(), col_j.tolist()):
+            self.col_heaps[i][j].push(int(dst_idx[2][i, 0]))
+        self._add_to_sums(self.row_heaps, self.row_mask, col_i, col_j, dst_col[col_i])
+
+        self.submatrix_sum = np.where(added, new_sum, self.submatrix_sum)
+        return added, both, src_in, dst_in
+
+    @staticmethod
+    def _find_min(heaps, sums: np.ndarray, i: np.ndarray, j: np.ndarray):
+        # Member with the smallest sum in each of the given submatrices, the earliest added
+        # among equal sums, read from the top of their heaps. An empty submatrix gives inf.
+        idx = np.array([heaps[row][sub].peek() for row, sub in zip(i.tolist(), j.tolist())], dtype=np.int64)
+        min_sum = np.where(idx >= 0, sums[i, j, idx], np.inf)
+        return idx, min_sum
+
+    def _check_and_del(self, count, i: np.ndarray, j: np.ndarray):
+        # Deletes the row or column with the smallest sum from the submatrices (i, j) whose
+        # density increases. Returns the indices of the submatrices where one was deleted.
+        rows_count = self.submatrix_rows_count[i, j]
+        cols_count = self.submatrix_cols_count[i, j]
+        total = self.submatrix_sum[i, j]
+        min_row, min_row_sum = self._find_min(self.row_heaps, self.row_sums, i, j)
+        min_col, min_col_sum = self._find_min(self.col_heaps, self.col_sums, i, j)
+
+        row_del_density = np.where((rows_count > 1) & (min_row_sum < np.inf),
+                                   self._density(rows_count - 1, cols_count, total - min_row_sum), np.inf)
+        col_del_density = np.where((cols_count > 1) & (min_col_sum < np.inf),
+                                   self._density(rows_count, cols_count - 1, total - min_col_sum), np.inf)
+        cur_density = self._density(rows_count, cols_count, total)
+
+        del_row = (cur_density > row_del_density) & (col_del_density < row_del_density)
+        del_col = ~del_row & (cur_density > col_del_density) & (row_del_density < col_del_density)
+
+        if del_row.any():
+            row_i, row_j, row_idx = i[del_row], j[del_row], min_row[del_row]
+            self.submatrix_rows_count[row_i, row_j] -= 1
+            self.row_mask[row_i, row_j, row_idx] = False
+            for row, sub, idx in zip(row_i.tolist(), row_j.tolist(), row_idx.tolist()):
+                self.row_heaps[row][sub].remove(idx)
+            self._add_to_sums(self.col_heaps, self.col_mask, row_i, row_j, -self._row_slices(count, row_i, row_idx))
+            self.submatrix_sum[row_i, row_j] -= min_row_sum[del_row]
+
+        if del_col.any():
+            col_i, col_j, col_idx = i[del_col], j[del_col], min_col[del_col]
+            self.submatrix_cols_count[col_i, col_j] -= 1
+            self.col_mask[col_i, col_j, col_idx] = False
+            for row, sub, idx in zip(col_i.tolist(), col_j.tolist(), col_idx.tolist()):
+                self.col_heaps[row][sub].remove(idx)
+            self._add_to_sums(self.row_heaps, self.row_mask, col_i, col_j, -self._col_slices(count, col_i, col_idx))
+            self.submatrix_sum[col_i, col_j] -= min_col_sum[del_col]
+
+        deleted = del_row | del_col
+        return i[deleted], j[deleted]
+
+    def decay(self, decay_factor: float) -> None:
+        """
+        Decay every submatrix and its sums by a specified decay factor.
+
+        Parameters:
+        - decay_factor (float): Factor by which the submatrices and sums are decayed.
+
+        """
+        self.submatrix_sum *= decay_factor
+        # Scaling every sum by a positive factor keeps the heaps ordered.
+        self.row_sums *= decay_factor
+        self.col_sums *= decay_factor
+        if not decay_factor > 0:
+            self._rebuild_heaps()
+
+    def recompute_sums(self, count) -> None:
+        """
+        Recompute the row, column and submatrix sums from the count tensor, keeping the
+        rows and columns of every submatrix.
+
+        Parameters:
+        - count: Count tensor of shape (r, b, b), dense or SparseCount.
+
+        """
+        r, _, b = self.shape
+        for i in range(r):
+            row_mask = self.row_mask[i].astype(float)
+            col_mask = self.col_mask[i].astype(float)
+            if isinstance(count, SparseCount):
+                flat_idx, values = count[i].flat_cells()
+                src, dst = np.divmod(flat_idx, b)
+                # One weighted bincount per submatrix, over the cells inside it.
+                weights = values * row_mask[:, src] * col_mask[:, dst]
+                self.row_sums[i] = [np.bincount(src, weights=w, minlength=b) for w in weights]
+                self.col_sums[i] = [np.bincount(dst, weights=w, minlength=b) for w in weights]
+            else:
+                mat = np.asarray(count[i], dtype=float)
+                self.row_sums[i] = row_mask * (col_mask @ mat.T)
+                self.col_sums[i] = col_mask * (row_mask @ mat)
+        self.submatrix_sum = self.row_sums.sum(axis=2)
+        self._rebuild_heaps()
+
+    def submatrix(self, i: int, j: int) -> dict:
+        """
+        Export submatrix j of row i as plain Python values.
+
+        Parameters:
+        - i (int): Row of the sketch.
+        - j (int): Index of the submatrix in the row.
+
+        Returns:
+        - dict: Row sums, column sums (in insertion order), sum and counts of the submatrix.
+        """
+        rows = np.flatnonzero(self.row_mask[i, j])
+        rows = rows[np.argsort(self.row_order[i, j, rows], kind='stable')]
+        cols = np.flatnonzero(self.col_mask[i, j])
+        cols = cols[np.argsort(self.col_order[i, j, cols], kind='stable')]
+        return {
+            'rows_sum': [[idx, float(self.row_sums[i, j, idx])] for idx in rows.tolist()],
+            'cols_sum': [[idx, float(self.col_sums[i, j, idx])] for idx in cols.tolist()],
+            'submatrix_sum': float(self.submatrix_sum[i, j]),
+            'submatrix_rows_count': int(self.submatrix_rows_count[i, j]),
+            'submatrix_cols_count': int(self.submatrix_cols_count[i, j]),
+        }
+
+    def to_list(self) -> list:
+        """
+        Export every submatrix as plain Python values.
+
+        Returns:
+        - list: For each row of the sketch, the output of submatrix for each of its submatrices.
+        """
+        r, d, _ = self.shape
+        return [[self.submatrix(i, j) for j in range(d)] for i in range(r)]
+
+    @classmethod
+    def from_list(cls, state: list, b: int) -> 'SubmatrixStack':
+        """
+        Build the stacked submatrices from the output of to_list.
+
+        Parameters:
+        - state (list): Exported submatrices.
+        - b (int): Number of buckets.
+
+        Returns:
+        - SubmatrixStack: The restored submatrices.
+        """
+        stack = cls(len(state), len(state[0]) if state else 0, b)
+        for i, row in enumerate(state):
+            for j, submatrix in enumerate(row):
+                order = 0
+                for mask, sums, ranks, key in ((stack.row_mask, stack.row_sums, stack.row_order, 'rows_sum'),
+                                               (stack.col_mask, stack.col_sums, stack.col_order, 'cols_sum')):
+                    for idx, value in submatrix[key]:
+                        mask[i, j, idx] = True
+                        sums[i, j, idx] = value
+                        ranks[i, j, idx] = order
+                        order += 1
+                stack.next_order[i, j] = order
+                stack.submatrix_sum[i, j] = submatrix['submatrix_sum']
+                stack.submatrix_rows_count[i, j] = submatrix['submatrix_rows_count']
+                stack.submatrix_cols_count[i, j] = submatrix['submatrix_cols_count']
+        stack._rebuild_heaps()
+        return stack
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from hcmsanoedgelocal import HcmsAnoedgeLocal
+
+
+def _stream(rng, n):
+    return [(int(src), int(dst)) for src, dst in rng.integers(0, 50, size=(n, 2))]
+
+
+def _fill(sketch, edges):
+    for src, dst in edges:
+        sketch.insert(src, dst, 1)
+        sketch.get_anoedgelocal_score(src, dst)
+
+
+@pytest.mark.parametrize("storage", ['dense', 'sparse'])
+def test_save_restore_round_trip_same_directory(tmp_path, storage):
+    rng = np.random.default_rng(0)
+    first, second = _stream(rng, 200), _stream(rng, 200)
+
+    reference = HcmsAnoedgeLocal(2, 64, 2, storage=storage, seed=1)
+    _fill(reference, first)
+    reference.save(str(tmp_path))
+
+    # Restoring memory-maps count.npy, so the second save overwrites the file backing the counts.
+    restored = HcmsAnoedgeLocal(2, 64, 2, storage=storage, seed=1)
+    restored.restore(str(tmp_path))
+    _fill(reference, second)
+    _fill(restored, second)
+    restored.save(str(tmp_path))
+
+    reloaded = HcmsAnoedgeLocal(2, 64, 2, storage=storage, seed=1)
+    reloaded.restore(str(tmp_path))
+    for src, dst in _stream(rng, 50):
+        reference.insert(src, dst, 1)
+        restored.insert(src, dst, 1)
+        reloaded.insert(src, dst, 1)
+        expected = reference.get_anoedgelocal_score(src, dst)
+        assert restored.get_anoedgelocal_score(src, dst) == pytest.approx(expected)
+        assert reloaded.get_anoedgelocal_score(src, dst) == pytest.approx(expected)
+    if storage == 'dense':
+        np.testing.assert_allclose(reloaded.count, reference.count)
+
+
+@pytest.mark.parametrize("storage", ['dense', 'sparse'])
+def test_dense_submatrices_seed_ties_by_lowest_cell(storage):
+    sketch = HcmsAnoedgeLocal(1, 8, 3, storage=storage, seed=1)
+    # Cell 5 has the largest count, then four cells tie at the second largest.
+    for flat, weight in ((60, 2), (5, 3), (41, 2), (9, 2), (22, 2), (63, 1)):
+        src, dst = divmod(flat, 8)
+        if storage == 'sparse':
+            sketch.count[0].add(src, dst, weight)
+        else:
+            sketch.count[0][src][dst] = weight
+    sketch.initialize_dense_submatrices()
+
+    seeds = [sketch.densest_matrices.submatrix(0, j) for j in range(3)]
+    assert [(s['rows_sum'][0][0], s['cols_sum'][0][0], s['submatrix_sum']) for s in seeds] == \
+        [(0, 5, 3.0), (1, 1, 2.0), (2, 6, 2.0)]
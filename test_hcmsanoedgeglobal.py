@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from hcmsanoedgeglobal import HcmsAnoedgeGlobal
+
+
+def _stream(rng, n):
+    # Skewed nodes, so the rows hold dense submatrices and seed cells repeat.
+    nodes = np.minimum(rng.zipf(1.5, size=(n, 2)), 200)
+    return [(int(src), int(dst)) for src, dst in nodes]
+
+
+@pytest.mark.parametrize("storage", ['dense', 'sparse'])
+@pytest.mark.parametrize("lazy_decay", [False, True])
+def test_vanishing_staleness_gives_exact_scores(storage, lazy_decay):
+    exact = HcmsAnoedgeGlobal(2, 32, lazy_decay, storage=storage, seed=1)
+    cached = HcmsAnoedgeGlobal(2, 32, lazy_decay, storage=storage, seed=1, staleness=1e-12)
+    for k, (src, dst) in enumerate(_stream(np.random.default_rng(0), 300)):
+        assert cached.get_anoedgeglobal_score(src, dst) == pytest.approx(exact.get_anoedgeglobal_score(src, dst), rel=1e-12)
+        for sketch in (exact, cached):
+            sketch.insert(src, dst, 1)
+            if k % 7 == 0:
+                sketch.remove(src, dst, 0.5)
+            if k % 50 == 0:
+                sketch.decay(0.9)
+
+
+def test_stale_density_is_an_earlier_greedy_density():
+    staleness = 0.2
+    sketch = HcmsAnoedgeGlobal(1, 32, seed=1, staleness=staleness)
+    # Exact density of every seed and the counts it was found on, after each insert.
+    history = []
+    stale = 0
+    for src, dst in _stream(np.random.default_rng(1), 400):
+        cell = (sketch.hash(src, 0), sketch.hash(dst, 0))
+        counts = np.array(sketch.count[0])
+        history.append((cell, counts, sketch.get_anoedgeglobal_density(counts, *cell)))
+
+        score = sketch.get_anoedgeglobal_score(src, dst)
+        # Counts only grow, so the mass when the cache started is at most the mass of
+        # any later counts.
+        assert any(seed == cell and score == pytest.approx(density, rel=1e-12)
+                   and np.abs(counts - earlier).sum() <= staleness * earlier.sum() + 1e-9
+                   for seed, earlier, density in history)
+        stale += score != pytest.approx(history[-1][2], rel=1e-12)
+        sketch.insert(src, dst, 1)
+    assert stale > 0
@@ -0,0 +1,42 @@
+import numpy as np
+
+from indexedminheap import IndexedMinHeap
+
+
+def _drain(heap):
+    popped = []
+    while len(heap):
+        popped.append(heap.peek())
+        heap.remove(popped[-1])
+    return popped
+
+
+def test_add_to_keys_keeps_heap_order():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        size = int(rng.integers(2, 16))
+        keys = rng.integers(0, 6, size).astype(float)
+        ties = np.arange(size)
+        heap = IndexedMinHeap(keys, ties)
+        for item in range(size):
+            heap.push(item)
+
+        items = rng.choice(size, int(rng.integers(1, size + 1)), replace=False)
+        heap.add_to_keys(items.tolist(), rng.integers(-3, 4, len(items)).astype(float).tolist())
+        assert _drain(heap) == sorted(range(size), key=lambda item: (keys[item], ties[item]))
+
+
+def test_heap_on_views_of_a_larger_array():
+    rng = np.random.default_rng(1)
+    sums = np.zeros((2, 3, 10))
+    order = np.zeros((2, 3, 10), dtype=np.int64)
+    heap = IndexedMinHeap(sums[1, 2], order[1, 2])
+    for position, item in enumerate(rng.choice(10, 6, replace=False).tolist()):
+        sums[1, 2, item] = rng.integers(0, 3)
+        order[1, 2, item] = position
+        heap.push(item)
+    members = list(heap.pos)
+
+    sums *= 0.5
+    heap.remove(members[0])
+    assert _drain(heap) == sorted(members[1:], key=lambda item: (sums[1, 2, item], order[1, 2, item]))
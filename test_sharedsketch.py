@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from sharedsketch import SharedSketch
+
+
+@pytest.fixture
+def shared():
+    sketch = SharedSketch.create(f"test_sharedsketch_{os.getpid()}", 2, 8)
+    yield sketch
+    sketch.close()
+
+
+def test_begin_read_waits_for_the_writer(shared):
+    reader = SharedSketch.attach(shared.shm.name)
+    try:
+        seq = reader.begin_read()
+        shared.header['seq'] += 1
+        assert not reader.validate_read(seq)
+        shared.header['seq'] += 1
+        assert reader.begin_read() == seq + 2
+    finally:
+        reader.close()
+
+
+def test_begin_read_times_out_on_an_unfinished_update(shared):
+    # A writer dying inside an update leaves the sequence number odd.
+    shared.header['seq'] += 1
+    reader = SharedSketch.attach(shared.shm.name)
+    try:
+        with pytest.raises(TimeoutError):
+            reader.begin_read(timeout=0.05)
+    finally:
+        reader.close()
@@ -0,0 +1,183 @@
+import numpy as np
+import pytest
+
+from sparsecount import SparseCount
+from submatrixstack import SubmatrixStack
+
+
+class DictSubmatrix:
+    # Reference Submatrix, keeping rows and columns in insertion-ordered dicts.
+    def __init__(self, row_idx, col_idx, value):
+        self.rows_sum = {row_idx: value}
+        self.cols_sum = {col_idx: value}
+        self.submatrix_sum = value
+        self.submatrix_rows_count = 1
+        self.submatrix_cols_count = 1
+
+    def getDensity(self):
+        return self.submatrix_sum / np.sqrt(self.submatrix_rows_count * self.submatrix_cols_count)
+
+    def checkAndAdd(self, row_idx, col_idx, mat, value=1.0):
+        cur_rows = self.submatrix_rows_count
+        cur_cols = self.submatrix_cols_count
+        row_sum = 0.0
+        col_sum = 0.0
+        row_flag = row_idx in self.rows_sum
+        col_flag = col_idx in self.cols_sum
+
+        if row_flag and col_flag:
+            self.submatrix_sum += value
+            self.rows_sum[row_idx] += value
+            self.cols_sum[col_idx] += value
+            return False
+
+        if not row_flag:
+            row_sum = float(np.sum(mat[row_idx, list(self.cols_sum)]))
+            cur_rows += 1
+        if not col_flag:
+            col_sum = float(np.sum(mat[list(self.rows_sum), col_idx]))
+            cur_cols += 1
+        new_sum = self.submatrix_sum + row_sum + col_sum
+        if not row_flag and not col_flag:
+            new_sum += float(mat[row_idx, col_idx])
+
+        if self.getDensity() < new_sum / np.sqrt(cur_rows * cur_cols):
+            if not row_flag and not col_flag:
+                self._add(self.rows_sum, self.cols_sum, row_idx, row_sum + float(mat[row_idx, col_idx]), mat[row_idx, :])
+                self._add(self.cols_sum, self.rows_sum, col_idx, col_sum + float(mat[row_idx, col_idx]), mat[:, col_idx])
+            elif not row_flag:
+                self._add(self.rows_sum, self.cols_sum, row_idx, row_sum, mat[row_idx, :])
+            else:
+                self._add(self.cols_sum, self.rows_sum, col_idx, col_sum, mat[:, col_idx])
+            self.submatrix_rows_count = len(self.rows_sum)
+            self.submatrix_cols_count = len(self.cols_sum)
+            self.submatrix_sum = new_sum
+            return True
+        return False
+
+    @staticmethod
+    def _add(sums, other_sums, idx, value, line):
+        sums[idx] = value
+        for other_idx in other_sums:
+            other_sums[other_idx] += float(line[other_idx])
+
+    def checkAndDel(self, mat):
+        min_row = (-1, float('inf'))
+        if self.submatrix_rows_count > 1:
+            for row_idx, row_sum in self.rows_sum.items():
+                if row_sum < min_row[1]:
+                    min_row = (row_idx, row_sum)
+        min_col = (-1, float('inf'))
+        if self.submatrix_cols_count > 1:
+            for col_idx, col_sum in self.cols_sum.items():
+                if col_sum < min_col[1]:
+                    min_col = (col_idx, col_sum)
+
+        row_del_density = float('inf')
+        if min_row[0] != -1:
+            row_del_density = (self.submatrix_sum - min_row[1]) / np.sqrt((self.submatrix_rows_count - 1) * self.submatrix_cols_count)
+        col_del_density = float('inf')
+        if min_col[0] != -1:
+            col_del_density = (self.submatrix_sum - min_col[1]) / np.sqrt(self.submatrix_rows_count * (self.submatrix_cols_count - 1))
+        cur_density = self.getDensity()
+
+        if cur_density > row_del_density and col_del_density < row_del_density:
+            del self.rows_sum[min_row[0]]
+            for col_idx in self.cols_sum:
+                self.cols_sum[col_idx] -= float(mat[min_row[0], col_idx])
+            self.submatrix_rows_count -= 1
+            self.submatrix_sum -= min_row[1]
+            return True
+        elif cur_density > col_del_density and row_del_density < col_del_density:
+            del self.cols_sum[min_col[0]]
+            for row_idx in self.rows_sum:
+                self.rows_sum[row_idx] -= float(mat[row_idx, min_col[0]])
+            self.submatrix_cols_count -= 1
+            self.submatrix_sum -= min_col[1]
+            return True
+        return False
+
+    def decay(self, decay_factor):
+        self.submatrix_sum *= decay_factor
+        for row_idx in self.rows_sum:
+            self.rows_sum[row_idx] *= decay_factor
+        for col_idx in self.cols_sum:
+            self.cols_sum[col_idx] *= decay_factor
+
+    def getLikelihoodScore(self, row_idx, col_idx, mat):
+        rows = list(self.rows_sum)
+        cols = list(self.cols_sum)
+        score = float(np.sum(mat[rows, col_idx]) + np.sum(mat[row_idx, cols]))
+        ctr = len(rows) + len(cols)
+        if row_idx in self.rows_sum and col_idx in self.cols_sum:
+            score -= float(mat[row_idx, col_idx])
+            ctr -= 1
+        return score / ctr if ctr != 0 else 0.0
+
+
+def _state(submatrix):
+    return ([[idx, value] for idx, value in submatrix.rows_sum.items()],
+            [[idx, value] for idx, value in submatrix.cols_sum.items()],
+            submatrix.submatrix_sum)
+
+
+def _min_member(sums):
+    # Member with the smallest sum, the earliest added among equal sums.
+    return min(sums, key=lambda item: item[1])[0] if sums else -1
+
+
+@pytest.mark.parametrize('storage', ['dense', 'sparse'])
+@pytest.mark.parametrize('seed', range(4))
+# 3 x 3 submatrices take the vectorized update, 2 x 2 the update one submatrix at a time.
+@pytest.mark.parametrize('r, d', [(3, 3), (2, 2)])
+def test_submatrix_stack_matches_dict_submatrix(storage, seed, r, d):
+    assert (r * d <= SubmatrixStack.LOOP_SIZE) == (d == 2)
+    rng = np.random.default_rng(seed)
+    b = int(rng.integers(4, 24))
+    count = SparseCount(r, b) if storage == 'sparse' else np.zeros((r, b, b))
+    stack = SubmatrixStack(r, d, b)
+    diagonal = np.broadcast_to(np.arange(d), (r, d))
+    stack.seed(diagonal, diagonal, 0.0)
+    reference = [[DictSubmatrix(j, j, 0.0) for j in range(d)] for _ in range(r)]
+
+    for step in range(600):
+        # Skewed cells, so the submatrices grow beyond a few rows and see many equal sums.
+        src = rng.zipf(1.3, r) % b
+        dst = rng.zipf(1.3, r) % b
+        if storage == 'sparse':
+            count.add_at(src, dst, 1.0)
+            dense = count.toarray()
+        else:
+            count[np.arange(r), src, dst] += 1.0
+            dense = count
+
+        scores = stack.update(count, src, dst, 1.0)
+        for i in range(r):
+            mat = dense[i]
+            ref_score = 0.0
+            for j, submatrix in enumerate(reference[i]):
+                if submatrix.checkAndAdd(int(src[i]), int(dst[i]), mat):
+                    while submatrix.checkAndDel(mat):
+                        pass
+                ref_score += submatrix.getLikelihoodScore(int(src[i]), int(dst[i]), mat)
+
+                rows, cols, total = _state(submatrix)
+                state = stack.submatrix(i, j)
+                assert [idx for idx, _ in state['rows_sum']] == [idx for idx, _ in rows]
+                assert [idx for idx, _ in state['cols_sum']] == [idx for idx, _ in cols]
+                assert [value for _, value in state['rows_sum']] == pytest.approx([value for _, value in rows])
+                assert [value for _, value in state['cols_sum']] == pytest.approx([value for _, value in cols])
+                assert state['submatrix_sum'] == pytest.approx(total)
+                assert stack.row_heaps[i][j].peek() == _min_member(state['rows_sum'])
+                assert stack.col_heaps[i][j].peek() == _min_member(state['cols_sum'])
+            assert scores[i] == pytest.approx(ref_score)
+
+        if step % 50 == 49:
+            count *= 0.5
+            stack.decay(0.5)
+            for row in reference:
+                for submatrix in row:
+                    submatrix.decay(0.5)
+
+    restored = SubmatrixStack.from_list(stack.to_list(), b)
+    assert restored.to_list() == stack.to_list()
@@ -1,10 +1,51 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterator
 import numpy as np
 import pandas as pd
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor
 import os
 
+def read_times_and_labels(data_base_path: str, dataset_name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse the edge times of Data.csv and the edge labels of Label.csv.
+
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray]: Time and label of every edge.
+    """
+    if has_cache(data_base_path, dataset_name):
+        columns = open_cache(data_base_path, dataset_name)
+        return columns['time'], columns['label']
+
+    graphs_file = f"{data_base_path}/{dataset_name}/Data.csv"
+    times = pd.read_csv(graphs_file, header=None, usecols=[2], dtype=np.int64).iloc[:, 0].to_numpy()
+
+    labels_file = f"{data_base_path}/{dataset_name}/Label.csv"
+    edge_labels = pd.read_csv(labels_file, header=None, dtype=np.int64).iloc[:, 0].to_numpy()
+
+    assert len(times) == len(edge_labels)
+    return times, edge_labels
+
+def count_anomalous_edges(times: np.ndarray, edge_labels: np.ndarray, time_window: int) -> np.ndarray:
+    """
+    Count the anomalous edges of each graph.
+
+    Args:
+    - times (np.ndarray): Time of every edge.
+    - edge_labels (np.ndarray): Label of every edge.
+    - time_window (int): Time window used to delimit graphs.
+
+    Returns:
+    - np.ndarray: Number of anomalous edges of each graph.
+    """
+    # Windows are numbered in order of first appearance, and window i gets label i.
+    window_ids, _ = pd.factorize(times // time_window)
+    return np.bincount(window_ids, weights=edge_labels)
+
 def compute_labels(data_base_path: str, dataset_name: str, time_window: int, edge_threshold: int) -> List[int]:
     """
     Compute labels for each graph based on the dataset provided.
@@ -19,42 +60,51 @@ def compute_labels(data_base_path: str, dataset_name: str, time_window: int, edg
     Returns:
     - List[int]: A list of computed labels.
     """
-    records = []
-    graphs_file = f"{data_base_path}/{dataset_name}/Data.csv"
-    with open(graphs_file, "r") as f:
-        for line in f:
-            if len(line) <= 1:
-                continue
-            src, dst, time = line.split("\n")[0].split(",")
-            records.append((int(src), int(dst), int(time)))
-
-    labels = []
-    labels_file = f"{data_base_path}/{dataset_name}/Label.csv"
-    with open(labels_file, "r") as f:
-        for line in f:
-            if len(line) <= 1:
-                continue
-            label = line.split("\n")[0]
-            labels.append(int(label))
+    times, edge_labels = read_times_and_labels(data_base_path, dataset_name)
+
+    labels = count_anomalous_edges(times, edge_labels, time_window) >= edge_threshold
+    labels = labels * 1
 
-    assert len(records) == len(labels)
+    return labels
 
-    record_labels = [(record[0], record[1], record[2], label) for record, label in zip(records, labels)]
+def iter_graphs(data_base_path: str, dataset_name: str, time_window: int, chunk_size: int = 1_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Stream the graphs of a dataset, one time window at a time. Data.csv is read in chunks
+    of chunk_size lines, so memory stays bounded by a chunk plus the current window.
 
-    data = pd.DataFrame(np.array(record_labels))
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+    - time_window (int): Time window used to delimit graphs.
+    - chunk_size (int): Number of lines parsed at once.
 
-    labels = []
-    data[2] = (data[2]/time_window).astype(int)
-    for i in pd.unique(data[2]):
-        labels.append(sum(data[data[2]==i][3]))
+    Yields:
+    - Tuple[np.ndarray, np.ndarray]: Source and destination nodes of the edges of a graph.
+    """
+    graphs_file = f"{data_base_path}/{dataset_name}/Data.csv"
+    chunks = pd.read_csv(graphs_file, header=None, names=['src', 'dst', 'time'], dtype=np.int64, chunksize=chunk_size)
 
-    labels = np.array(labels)
-    labels = labels >= edge_threshold
-    labels = labels * 1
+    cur_window = None
+    cur_src, cur_dst = [], []
+    for chunk in chunks:
+        src = chunk['src'].to_numpy()
+        dst = chunk['dst'].to_numpy()
+        window = chunk['time'].to_numpy() // time_window
 
-    return labels
+        # A new graph starts wherever the window changes.
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(window)) + 1, [len(window)]))
+        for begin, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            if cur_window is not None and window[begin] != cur_window:
+                yield np.concatenate(cur_src), np.concatenate(cur_dst)
+                cur_src, cur_dst = [], []
+            cur_window = window[begin]
+            cur_src.append(src[begin:end])
+            cur_dst.append(dst[begin:end])
+
+    if cur_src:
+        yield np.concatenate(cur_src), np.concatenate(cur_dst)
 
-def compute_graphs(data_base_path: str, dataset_name: str, time_window: int, edge_threshold: int) -> List[Tuple[List[int], List[int]]]:
+def compute_graphs(data_base_path: str, dataset_name: str, time_window: int, edge_threshold: int) -> List[Tuple[np.ndarray, np.ndarray]]:
     """
     Compute graphs based on the dataset information, time window, and edge threshold.
 
@@ -65,52 +115,189 @@ def compute_graphs(data_base_path: str, dataset_name: str, time_window: int, edg
     - edge_threshold (int): Minimum number of anomalous edges for the graph to be considered anomalous.
     
     Returns:
-    - List[Tuple[List[int], List[int]]]: A list of tuples representing computed graphs.
+    - List[Tuple[np.ndarray, np.ndarray]]: A list of tuples representing computed graphs.
     """
-    graphs = []
-    graphs_file = f"{data_base_path}/{dataset_name}/Data.csv"
+    return list(iter_graphs(data_base_path, dataset_name, time_window))
 
-    with open(graphs_file, "r") as graphs_file_ptr:
-        cur_time = 0
-        cur_src, cur_dst = [], []
-        for line in graphs_file_ptr:
-            s, d, t = map(int, line.strip().split(','))
-            if t // time_window != cur_time:
-                graphs.append((cur_src, cur_dst))
-                cur_time = t // time_window
-                cur_src, cur_dst = [], []
-            cur_src.append(s)
-            cur_dst.append(d)
+def save_dataset_labels(data_base_path: str, dataset_name: str, configurations: List[Tuple[int, int]]) -> List[str]:
+    """
+    Compute and save the labels of a dataset for several (time_window, edge_threshold)
+    configurations, parsing the dataset once. Label files newer than Data.csv and
+    Label.csv are up to date and are not rewritten.
+
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+    - configurations (List[Tuple[int, int]]): Pairs of time window and edge threshold.
+
+    Returns:
+    - List[str]: The label files written.
+    """
+    inputs = [f"{data_base_path}/{dataset_name}/Data.csv", f"{data_base_path}/{dataset_name}/Label.csv"]
+
+    stale = []
+    for time_window, edge_threshold in configurations:
+        label_file = f"{data_base_path}/{dataset_name}/Label_{time_window}_{edge_threshold}.csv"
+        if not _is_up_to_date(label_file, inputs):
+            stale.append((time_window, edge_threshold, label_file))
+    if not stale:
+        return []
+
+    times, edge_labels = read_times_and_labels(data_base_path, dataset_name)
+    anomalous_edges = {}
+    for time_window, edge_threshold, label_file in stale:
+        if time_window not in anomalous_edges:
+            anomalous_edges[time_window] = count_anomalous_edges(times, edge_labels, time_window)
+        labels = (anomalous_edges[time_window] >= edge_threshold) * 1
+
+        # Create directory if it doesn't exist
+        os.makedirs(os.path.dirname(label_file), exist_ok=True)
+
+        # Save labels to file
+        with open(label_file, "w") as file:
+            file.write('\n'.join(map(str, labels)))
 
-    graphs.append((cur_src, cur_dst)) 
-    return graphs
+    return [label_file for _, _, label_file in stale]
 
-def compute_and_save_labels():
+def compute_and_save_labels(workers: int = None):
     """
     Compute labels for each dataset in a dataset list for each time_window and edge_threshold.
+    Datasets are processed concurrently in a process pool, and each is parsed once.
+
+    Args:
+    - workers (int): Number of processes. Defaults to one per dataset.
     """
     dataset_list = ['DARPA', 'DDOS2019', 'IDS2018', 'ISCX']
     time_windows = [15, 30, 60, 60]
     edge_thresholds = [25, 50, 50, 100]
     data_base_path = 'DATA'
 
-    
-    for dataset_name in dataset_list:
-        for time_window, edge_threshold in zip(time_windows, edge_thresholds):
-            labels = compute_labels(data_base_path, dataset_name, time_window, edge_threshold)
-            label_file = f"{data_base_path}/{dataset_name}/Label_{time_window}_{edge_threshold}.csv"
+    configurations = list(zip(time_windows, edge_thresholds))
+    with ProcessPoolExecutor(max_workers=workers or len(dataset_list)) as pool:
+        futures = [pool.submit(save_dataset_labels, data_base_path, dataset_name, configurations)
+                   for dataset_name in dataset_list]
+        for future in futures:
+            future.result()
+
+
+def _is_up_to_date(output: str, inputs: List[str]) -> bool:
+    # An output is up to date when it is newer than all of its inputs.
+    return os.path.exists(output) and os.path.getmtime(output) >= max(os.path.getmtime(path) for path in inputs)
+
+CACHE_COLUMNS = ('src', 'dst', 'time', 'label')
+
+def _cache_dir(data_base_path: str, dataset_name: str) -> str:
+    return f"{data_base_path}/{dataset_name}/cache"
+
+def has_cache(data_base_path: str, dataset_name: str) -> bool:
+    """
+    Return True if the binary cache of a dataset exists and is newer than Data.csv and Label.csv.
+    """
+    inputs = [f"{data_base_path}/{dataset_name}/Data.csv", f"{data_base_path}/{dataset_name}/Label.csv"]
+    inputs = [path for path in inputs if os.path.exists(path)]
+    cache_dir = _cache_dir(data_base_path, dataset_name)
+    return all(os.path.exists(f"{cache_dir}/{column}.npy") and (not inputs or _is_up_to_date(f"{cache_dir}/{column}.npy", inputs))
+               for column in CACHE_COLUMNS)
+
+def convert_dataset(data_base_path: str, dataset_name: str, time_windows: List[int] = ()) -> str:
+    """
+    Convert Data.csv and Label.csv into a binary columnar cache: one .npy file per column
+    (src, dst, time and label), plus the window offsets of each time window.
+
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+    - time_windows (List[int]): Time windows whose offsets are precomputed. Offsets of
+      other time windows are computed and saved when first needed.
+
+    Returns:
+    - str: The cache directory.
+    """
+    graphs_file = f"{data_base_path}/{dataset_name}/Data.csv"
+    edges = pd.read_csv(graphs_file, header=None, names=['src', 'dst', 'time'], dtype=np.int64)
+
+    labels_file = f"{data_base_path}/{dataset_name}/Label.csv"
+    edge_labels = pd.read_csv(labels_file, header=None, dtype=np.int64).iloc[:, 0].to_numpy()
+
+    assert len(edges) == len(edge_labels)
+
+    cache_dir = _cache_dir(data_base_path, dataset_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Stale window offsets would not match the new columns.
+    for file_name in os.listdir(cache_dir):
+        if file_name.startswith('windows_'):
+            os.remove(f"{cache_dir}/{file_name}")
+
+    for column in ('src', 'dst', 'time'):
+        np.save(f"{cache_dir}/{column}.npy", edges[column].to_numpy())
+    np.save(f"{cache_dir}/label.npy", edge_labels)
+
+    for time_window in time_windows:
+        window_offsets(data_base_path, dataset_name, time_window)
+    return cache_dir
 
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(label_file), exist_ok=True)
+def open_cache(data_base_path: str, dataset_name: str) -> Dict[str, np.ndarray]:
+    """
+    Open the binary cache of a dataset written by convert_dataset.
+
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+
+    Returns:
+    - Dict[str, np.ndarray]: Read-only memory maps of the src, dst, time and label columns.
+    """
+    cache_dir = _cache_dir(data_base_path, dataset_name)
+    return {column: np.load(f"{cache_dir}/{column}.npy", mmap_mode='r') for column in CACHE_COLUMNS}
+
+def window_offsets(data_base_path: str, dataset_name: str, time_window: int) -> np.ndarray:
+    """
+    Return the window offsets of a cached dataset: graph i holds the edges
+    offsets[i]:offsets[i + 1]. A new graph starts wherever the window changes, as in
+    iter_graphs. The offsets are saved in the cache the first time they are computed.
+
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+    - time_window (int): Time window used to delimit graphs.
 
-            # Save labels to file
-            with open(label_file, "w") as file:
-                file.write('\n'.join(map(str, labels)))
+    Returns:
+    - np.ndarray: Offsets of the graphs, followed by the number of edges.
+    """
+    offsets_file = f"{_cache_dir(data_base_path, dataset_name)}/windows_{time_window}.npy"
+    if os.path.exists(offsets_file):
+        return np.load(offsets_file)
+
+    window = open_cache(data_base_path, dataset_name)['time'] // time_window
+    offsets = np.concatenate(([0], np.flatnonzero(np.diff(window)) + 1, [len(window)])).astype(np.int64)
+    if len(window) == 0:
+        offsets = offsets[:1]
+    np.save(offsets_file, offsets)
+    return offsets
+
+def iter_cached_graphs(data_base_path: str, dataset_name: str, time_window: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Iterate over the graphs of a cached dataset. Graphs are slices of the memory-mapped
+    columns, so nothing is copied.
 
+    Args:
+    - data_base_path (str): Path to the base directory containing dataset files.
+    - dataset_name (str): The name of the dataset.
+    - time_window (int): Time window used to delimit graphs.
+
+    Yields:
+    - Tuple[np.ndarray, np.ndarray]: Source and destination nodes of the edges of a graph.
+    """
+    columns = open_cache(data_base_path, dataset_name)
+    offsets = window_offsets(data_base_path, dataset_name, time_window).tolist()
+    for begin, end in zip(offsets[:-1], offsets[1:]):
+        yield columns['src'][begin:end], columns['dst'][begin:end]
 
-def load_graph_data(data_base_path: str, dataset_name: str, time_window: int, edge_threshold: int) -> Tuple[List[Dict[str, List[int]]], List[int]]:
+def load_graph_data(data_base_path: str, dataset_name: str, time_window: int, edge_threshold: int) -> Tuple[Iterator[Dict[str, np.ndarray]], List[int]]:
     """
     Load graph data and corresponding labels for a specific dataset, time window, and edge threshold.
+    Graphs are sliced from the binary cache when convert_dataset was run and the cache
+    is up to date, and streamed from the dataset file otherwise.
 
     Args:
     - data_base_path (str): Base path containing dataset files.
@@ -119,9 +306,12 @@ def load_graph_data(data_base_path: str, dataset_name: str, time_window: int, ed
     - edge_threshold (int): Threshold for edges.
 
     Returns:
-    - Tuple[List[Dict[str, Any]], List[int]]: A tuple containing loaded graph records (as dictionaries) and labels.
+    - Tuple[Iterator[Dict[str, np.ndarray]], List[int]]: A tuple containing an iterator over graph records (as dictionaries) and labels.
     """
-    graphs = compute_graphs(data_base_path, dataset_name, time_window, edge_threshold)
+    if has_cache(data_base_path, dataset_name):
+        graphs = iter_cached_graphs(data_base_path, dataset_name, time_window)
+    else:
+        graphs = iter_graphs(data_base_path, dataset_name, time_window)
 
     label_file = f"{data_base_path}/{dataset_name}/Label_{time_window}_{edge_threshold}.csv"
 
@@ -129,8 +319,6 @@ def load_graph_data(data_base_path: str, dataset_name: str, time_window: int, ed
     with open(label_file, "r") as file:
         labels = [int(line.strip()) for line in file]
 
-    records = []
-    for src, dst in graphs:
-        records.append({'src': src, 'dst': dst})
+    records = ({'src': src, 'dst': dst} for src, dst in graphs)
 
     return records, labels
\ No newline at end of file